@@ -0,0 +1,54 @@
+"""Micro-benchmark for instruction canonicalization + stable hashing.
+
+Simulates the doctor materializer workload (the same catalog texts repeated
+for many patients/days) and compares the raw helpers with the memoized ones.
+
+Usage:
+    python bench_instruction_catalog.py [--rows 200000]
+"""
+
+import argparse
+import time
+
+import instruction_catalog
+
+
+def _workload(rows: int) -> list[tuple[str, str]]:
+    texts: list[tuple[str, str]] = []
+    for groups in instruction_catalog._CATALOG.values():
+        for group, items in groups.items():
+            for raw in items:
+                texts.append((group, raw))
+    return [texts[i % len(texts)] for i in range(rows)]
+
+
+def _run(canon, index, work: list[tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    for group, raw in work:
+        g = instruction_catalog.canonical_group(group)
+        index(g, canon(raw))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    work = _workload(args.rows)
+    distinct = len(set(work))
+
+    raw_canon = instruction_catalog._canonical_instruction_text.__wrapped__
+    raw_index = instruction_catalog.stable_instruction_index.__wrapped__
+    uncached = _run(lambda v: raw_canon(v or ""), raw_index, work)
+    cached = _run(instruction_catalog.canonical_instruction_text, instruction_catalog.stable_instruction_index, work)
+
+    print(f"rows={len(work)} distinct_texts={distinct}")
+    print(f"uncached: {uncached * 1000:.1f} ms ({uncached / len(work) * 1e6:.2f} us/row)")
+    print(f"cached:   {cached * 1000:.1f} ms ({cached / len(work) * 1e6:.2f} us/row)")
+    print(f"speedup:  {uncached / cached:.1f}x")
+    print(f"cache:    {instruction_catalog.cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Micro-benchmark for doctor dashboard list serialization.
+
+Builds N synthetic /patients/by-doctor-episodes rows (as DB result tuples) and
+compares the response paths:
+  * model:    one PatientEpisodePublic per row, then response_model style
+              validation + FastAPI's jsonable_encoder + stdlib json (pre-fast path)
+  * adapter:  dicts validated and dumped by TypeAdapter (FAST_JSON_RESPONSES=0)
+  * fast:     dicts encoded directly by fast_json (default)
+
+Usage:
+    python bench_serialization.py [--rows 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import fast_json
+import schemas
+
+_FIELDS = tuple(schemas.PatientEpisodePublic.model_fields)
+_ADAPTER = TypeAdapter(List[schemas.PatientEpisodePublic])
+
+
+def _rows(n: int) -> list[tuple]:
+    base = date(2025, 1, 1)
+    return [
+        (
+            i // 3 + 1, i + 1, f"patient{i // 3}", f"Patient {i // 3}", "Endodontics", "Dr. Mehta",
+            "Root Canal/Endodontic", None if i % 2 else "Molar", base + timedelta(days=i % 365),
+            dt_time(9 + i % 8, 30), bool(i % 3 == 0), bool(i % 3 == 0),
+        )
+        for i in range(n)
+    ]
+
+
+def _model_path(rows: list[tuple]) -> bytes:
+    out = [schemas.PatientEpisodePublic(**dict(zip(_FIELDS, r))) for r in rows]
+    validated = _ADAPTER.validate_python([o.model_dump() for o in out])
+    return json.dumps(jsonable_encoder(validated), separators=(",", ":")).encode("utf-8")
+
+
+def _adapter_path(rows: list[tuple]) -> bytes:
+    out = [dict(zip(_FIELDS, r)) for r in rows]
+    return _ADAPTER.dump_json(_ADAPTER.validate_python(out))
+
+
+def _fast_path(rows: list[tuple]) -> bytes:
+    return fast_json.dumps([dict(zip(_FIELDS, r)) for r in rows])
+
+
+def _best(fn, rows: list[tuple], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = _rows(args.rows)
+    expected = json.loads(_model_path(rows))
+    for name, fn in (("adapter", _adapter_path), ("fast", _fast_path)):
+        if json.loads(fn(rows)) != expected:
+            raise SystemExit(f"{name} output differs from the model path")
+
+    print(f"rows={len(rows)} repeat={args.repeat} fast_json={fast_json.backend()} bytes={len(_fast_path(rows))}")
+    model = _best(_model_path, rows, args.repeat)
+    for name, fn in (("model", _model_path), ("adapter", _adapter_path), ("fast", _fast_path)):
+        t = model if name == "model" else _best(fn, rows, args.repeat)
+        print(f"{name + ':':9}{t * 1000:8.1f} ms ({t / len(rows) * 1e6:.2f} us/row, {model / t:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""completed_patient_episodes: indexed copy of the completed_patients view.
+
+The view (one row per completed + locked episode joined with its patient) stays
+for ad-hoc SQL. /completed-patients reads this table instead. Its primary key
+is episode_id and it has indexes on username, email and phone, so filters and
+keyset pages never re-join treatment_episodes with patients.
+
+Maintenance follows latest_episodes: refresh(db, patient_ids) recomputes those
+patients' rows inside the caller's transaction and is called wherever an
+episode is locked or mirrored. sync_missing() runs at startup and adds any rows
+written while the table did not exist yet; rebuild() recomputes everything.
+"""
+
+from typing import Iterable
+
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+_IN_CHUNK = 1000
+
+
+def _source_query():
+    te = models.TreatmentEpisode
+    p = models.Patient
+    return (
+        select(
+            te.id.label("episode_id"),
+            p.id.label("patient_id"),
+            p.username.label("username"),
+            p.name.label("name"),
+            p.phone.label("phone"),
+            p.email.label("email"),
+            te.department.label("department"),
+            te.doctor.label("doctor"),
+            te.treatment.label("treatment"),
+            te.subtype.label("treatment_subtype"),
+            te.procedure_date.label("procedure_date"),
+            te.procedure_time.label("procedure_time"),
+            te.created_at.label("episode_created_at"),
+            p.last_completed_at.label("patient_last_completed_at"),
+        )
+        .join(p, p.id == te.patient_id)
+        .where(te.procedure_completed == True, te.locked == True)
+    )
+
+
+def _columns() -> list[str]:
+    return [c.name for c in _source_query().selected_columns]
+
+
+async def refresh(db: AsyncSession, patient_ids: Iterable[int]) -> None:
+    """Recompute the completed rows of patient_ids; no commit."""
+    ids = sorted({int(p) for p in patient_ids})
+    table = models.CompletedPatientEpisode.__table__
+    te = models.TreatmentEpisode
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    for start in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[start:start + _IN_CHUNK]
+        rows = (await db.execute(_source_query().where(te.patient_id.in_(chunk)))).mappings().all()
+        if rows:
+            stmt = dialect_insert(table).values([dict(r) for r in rows])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.episode_id],
+                set_={c: stmt.excluded[c] for c in _columns() if c != "episode_id"},
+            )
+            await db.execute(stmt)
+        # Episodes that are no longer completed+locked (or were deleted) drop out.
+        stale = delete(table).where(table.c.patient_id.in_(chunk))
+        keep = [int(r["episode_id"]) for r in rows]
+        if keep:
+            stale = stale.where(table.c.episode_id.not_in(keep))
+        await db.execute(stale)
+
+
+async def sync_missing(db: AsyncSession) -> int:
+    """Insert rows for completed episodes the table doesn't have yet; commits."""
+    table = models.CompletedPatientEpisode.__table__
+    te = models.TreatmentEpisode
+    src = _source_query().where(~exists().where(table.c.episode_id == te.id))
+    res = await db.execute(insert(table).from_select(_columns(), src))
+    await db.commit()
+    return int(res.rowcount or 0)
+
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute the whole table from treatment_episodes + patients; commits."""
+    table = models.CompletedPatientEpisode.__table__
+    await db.execute(delete(table))
+    res = await db.execute(insert(table).from_select(_columns(), _source_query()))
+    await db.commit()
+    return int(res.rowcount or 0)
@@ -157,4 +157,16 @@ from typing import AsyncGenerator
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def worker_count() -> int:
+    """Server worker processes as advertised by WEB_CONCURRENCY / UVICORN_WORKERS (default 1).
+
+    Per-process state (in-memory caches, rate-limit buckets) is only safe when this is 1.
+    """
+    for var in ("WEB_CONCURRENCY", "UVICORN_WORKERS"):
+        try:
+            return max(1, int(os.getenv(var, "")))
+        except Exception:
+            continue
+    return 1
@@ -0,0 +1,104 @@
+"""Doctor name -> doctors.id resolution for patients/treatment_episodes.doctor_id.
+
+Patients pick their doctor as free text ("Dr. Mehta", "dr mehta", "Mehta"), which
+is stored in patients.doctor / treatment_episodes.doctor. Dashboards filter on the
+indexed doctor_id foreign key instead; this module maps the text onto a doctor row.
+
+Matching: case-insensitive, whitespace-collapsed, with a leading "Dr."/"Dr"
+removed, against doctors.name and doctors.username. Names shared by several
+doctors are ambiguous and stay unresolved (NULL doctor_id).
+
+The doctors table is small, so it is cached whole in-process and reloaded on a
+miss at most every RELOAD_MIN_INTERVAL_S seconds (or via invalidate()).
+"""
+
+import re
+import time
+from typing import Any, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+RELOAD_MIN_INTERVAL_S = 60.0
+
+_PREFIX_RE = re.compile(r"^dr\.?\s+|^dr\.")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# normalized name/username -> doctor id (None = ambiguous)
+_by_name: dict[str, Optional[int]] = {}
+_loaded_at: Optional[float] = None
+
+
+def normalize_doctor_name(name: Optional[str]) -> str:
+    s = _WHITESPACE_RE.sub(" ", (name or "").strip().lower())
+    return _PREFIX_RE.sub("", s).strip()
+
+
+def invalidate() -> None:
+    global _loaded_at
+    _loaded_at = None
+
+
+async def _load(db: AsyncSession) -> None:
+    global _by_name, _loaded_at
+    res = await db.execute(select(models.Doctor.id, models.Doctor.name, models.Doctor.username))
+    by_name: dict[str, Optional[int]] = {}
+    usernames: dict[str, int] = {}
+    for doc_id, name, username in res.all():
+        key = normalize_doctor_name(name)
+        if key:
+            if key in by_name and by_name[key] != doc_id:
+                print(f"[doctor-directory] ambiguous doctor name '{key}'; not resolving it")
+                by_name[key] = None
+            else:
+                by_name[key] = int(doc_id)
+        if username:
+            usernames[username.strip().lower()] = int(doc_id)
+    # Names win over usernames when both match different doctors.
+    for key, doc_id in usernames.items():
+        by_name.setdefault(key, doc_id)
+    _by_name = by_name
+    _loaded_at = time.monotonic()
+
+
+async def resolve(db: AsyncSession, name: Optional[str]) -> Optional[int]:
+    """doctors.id for a free-text doctor name, or None when unknown/ambiguous."""
+    key = normalize_doctor_name(name)
+    if not key:
+        return None
+    stale = _loaded_at is None or (key not in _by_name and time.monotonic() - _loaded_at >= RELOAD_MIN_INTERVAL_S)
+    if stale:
+        await _load(db)
+    return _by_name.get(key)
+
+
+async def backfill(db: AsyncSession) -> dict[str, Any]:
+    """Fill doctor_id on patients and treatment_episodes rows that only have the text name.
+
+    Works per distinct name string (there are few), so each UPDATE hits every row
+    of that name at once. Commits at the end.
+    """
+    await _load(db)
+    out: dict[str, Any] = {"unresolved": []}
+    unresolved: set[str] = set()
+    for model in (models.Patient, models.TreatmentEpisode):
+        table = model.__table__
+        res = await db.execute(
+            select(table.c.doctor).where(table.c.doctor_id.is_(None), table.c.doctor.is_not(None), table.c.doctor != "").distinct()
+        )
+        updated = 0
+        for (name,) in res.all():
+            doc_id = await resolve(db, name)
+            if doc_id is None:
+                unresolved.add(name)
+                continue
+            r = await db.execute(
+                update(table).where(table.c.doctor == name, table.c.doctor_id.is_(None)).values(doctor_id=doc_id)
+            )
+            updated += int(r.rowcount or 0)
+        out[table.name] = updated
+    await db.commit()
+    out["unresolved"] = sorted(unresolved)
+    return out
@@ -0,0 +1,38 @@
+"""Fast JSON encoding for large list responses built from trusted server data.
+
+Doctor dashboard lists are assembled by the server from DB rows, so validating
+every row through a Pydantic model (and again through response_model) only
+costs time. Those endpoints build plain dicts whose keys and types already
+match the response schema and encode them here.
+
+Encoder: orjson when installed, else pydantic_core.to_json (always available
+with FastAPI). Both emit compact JSON with ISO dates/times, the same bytes
+as TypeAdapter.dump_json for these rows. Anything orjson can't encode natively
+goes through pydantic_core.to_jsonable_python.
+
+FAST_JSON_RESPONSES=0 switches callers back to the validated path.
+"""
+
+import os
+from typing import Any
+
+from pydantic_core import to_json, to_jsonable_python
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def enabled() -> bool:
+    return os.getenv("FAST_JSON_RESPONSES", "1").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def backend() -> str:
+    return "orjson" if orjson is not None else "pydantic_core"
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=to_jsonable_python)
+    return to_json(value)
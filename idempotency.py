@@ -0,0 +1,251 @@
+"""Idempotency-Key support for retried mobile writes.
+
+Clients send `Idempotency-Key: <opaque string>` on a POST. The first successful
+(2xx) response is stored for IDEMPOTENCY_TTL_SECONDS (default 86400) and
+repeats of the same key replay it instead of running the handler again
+(response header `Idempotent-Replayed: true`).
+
+  * Keys are scoped by method + path + the caller's Authorization value, so two
+    users can never see each other's responses.
+  * The request body is fingerprinted; reusing a key with a different body is a
+    client bug and gets 422.
+  * Concurrent repeats inside one process wait for the first to finish.
+  * Non-2xx responses are not stored, so a retry after an error runs normally.
+
+Backends (env IDEMPOTENCY_BACKEND):
+  * memory (default): bounded LRU (IDEMPOTENCY_MEMORY_MAX_KEYS, default 5000).
+  * db: idempotency_records table, shared across workers.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+from database import AsyncSessionLocal
+
+HEADER = "idempotency-key"
+REPLAY_HEADER = b"idempotent-replayed"
+MAX_KEY_LENGTH = 255
+# Response headers that must be recomputed rather than replayed.
+_SKIP_HEADERS = {b"content-length", b"date", b"server", b"set-cookie"}
+
+
+class StoredResponse:
+    def __init__(self, fingerprint: str, status_code: int, headers: list[tuple[bytes, bytes]], body: bytes):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+
+class MemoryIdempotencyStore:
+    def __init__(self, max_keys: int = 5000):
+        self.max_keys = max(1, int(max_keys))
+        self._items: "OrderedDict[str, tuple[float, StoredResponse]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        hit = self._items.get(key)
+        if hit is None:
+            return None
+        expires, resp = hit
+        if expires <= time.time():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return resp
+
+    async def put(self, key: str, resp: StoredResponse, ttl_s: int) -> None:
+        self._items[key] = (time.time() + ttl_s, resp)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_keys:
+            self._items.popitem(last=False)
+
+
+class DbIdempotencyStore:
+    # Expired rows are purged opportunistically every this many writes.
+    PRUNE_EVERY = 200
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[StoredResponse]:
+        rec = models.IdempotencyRecord
+        async with self._session_factory() as db:
+            row = (await db.execute(
+                select(rec.fingerprint, rec.status_code, rec.headers, rec.body)
+                .where(rec.key == key, rec.expires_at > datetime.utcnow())
+            )).first()
+        if row is None:
+            return None
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(row.headers or "[]")]
+        return StoredResponse(row.fingerprint, int(row.status_code), headers, bytes(row.body))
+
+    async def put(self, key: str, resp: StoredResponse, ttl_s: int) -> None:
+        rec = models.IdempotencyRecord
+        now = datetime.utcnow()
+        values = {
+            "key": key,
+            "fingerprint": resp.fingerprint,
+            "status_code": resp.status_code,
+            "headers": json.dumps([[k.decode("latin-1"), v.decode("latin-1")] for k, v in resp.headers]),
+            "body": resp.body,
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=ttl_s),
+        }
+        async with self._session_factory() as db:
+            insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+            stmt = insert(rec.__table__).values(**values)
+            # A concurrent worker may have stored the same key; refresh only if the old one expired.
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[rec.__table__.c.key],
+                set_={k: stmt.excluded[k] for k in values if k != "key"},
+                where=rec.__table__.c.expires_at <= now,
+            )
+            await db.execute(stmt)
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                await db.execute(delete(rec).where(rec.expires_at <= now))
+            await db.commit()
+
+
+def _make_store():
+    name = os.getenv("IDEMPOTENCY_BACKEND", "memory").strip().lower()
+    if name in {"db", "sql", "postgres", "sqlite"}:
+        return DbIdempotencyStore()
+    try:
+        max_keys = int(os.getenv("IDEMPOTENCY_MEMORY_MAX_KEYS", "5000"))
+    except Exception:
+        max_keys = 5000
+    return MemoryIdempotencyStore(max_keys=max_keys)
+
+
+def _ttl_seconds() -> int:
+    try:
+        return max(1, int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")))
+    except Exception:
+        return 86400
+
+
+def _header(scope: dict, name: bytes) -> Optional[bytes]:
+    for k, v in scope.get("headers") or []:
+        if k.lower() == name:
+            return v
+    return None
+
+
+class IdempotencyMiddleware:
+    """Pure ASGI middleware applying Idempotency-Key handling to POSTs on `paths`."""
+
+    def __init__(self, app, paths: Iterable[str], store=None, ttl_seconds: Optional[int] = None):
+        self.app = app
+        self.paths = set(paths)
+        self.store = store or _make_store()
+        self.ttl_seconds = ttl_seconds or _ttl_seconds()
+        self._inflight: dict[str, asyncio.Event] = {}
+        print(f"[idempotency] store={type(self.store).__name__} ttl={self.ttl_seconds}s paths={sorted(self.paths)}")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        raw_key = _header(scope, HEADER.encode())
+        if not raw_key:
+            await self.app(scope, receive, send)
+            return
+        if len(raw_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters"})
+            return
+
+        # Buffer the body so it can be fingerprinted and then replayed to the app.
+        chunks = []
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        h = hashlib.sha256()
+        for part in (scope["method"].encode(), scope["path"].encode(), _header(scope, b"authorization") or b"", raw_key):
+            h.update(part)
+            h.update(b"\0")
+        key = h.hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        # Same key already running in this process: wait for it, then try to replay.
+        while key in self._inflight:
+            await self._inflight[key].wait()
+        try:
+            stored = await self.store.get(key)
+        except Exception as e:
+            print(f"[idempotency] lookup failed (processing normally): {e}")
+            stored = None
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                await _send_json(send, 422, {"detail": "Idempotency-Key was already used with a different request body"})
+                return
+            await send({
+                "type": "http.response.start",
+                "status": stored.status_code,
+                "headers": stored.headers + [(REPLAY_HEADER, b"true"), (b"content-length", str(len(stored.body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": stored.body})
+            return
+
+        event = asyncio.Event()
+        self._inflight[key] = event
+        captured: dict[str, Any] = {"status": None, "headers": [], "body": []}
+        sent_body = False
+
+        async def replay_receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [(k, v) for k, v in message.get("headers", []) if k.lower() not in _SKIP_HEADERS]
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            status_code = captured["status"]
+            if status_code is not None and 200 <= status_code < 300:
+                try:
+                    await self.store.put(
+                        key,
+                        StoredResponse(fingerprint, status_code, captured["headers"], b"".join(captured["body"])),
+                        self.ttl_seconds,
+                    )
+                except Exception as e:
+                    print(f"[idempotency] store failed: {e}")
+        finally:
+            del self._inflight[key]
+            event.set()
+
+
+async def _send_json(send, status_code: int, payload: dict) -> None:
+    data = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())],
+    })
+    await send({"type": "http.response.body", "body": data})
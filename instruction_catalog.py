@@ -1,28 +1,63 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 import re
+from functools import lru_cache
+from types import MappingProxyType
 
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# Canonicalization/hashing results are memoized: the same few dozen instruction
+# strings recur for every patient and day, so a small bounded LRU covers them.
+try:
+    _CACHE_SIZE = max(0, int(os.getenv("INSTRUCTION_CACHE_SIZE", "4096")))
+except Exception:
+    _CACHE_SIZE = 4096
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+# Treatment aliases, lower-cased input -> canonical name (mirrors Flutter AppState._canonicalTreatment).
+_TREATMENT_ALIASES: Dict[str, str] = {
+    # Back-compat alias
+    "prosthesis": "Prosthesis Fitted",
+    # Case-insensitive normalization for known treatments in this catalog
+    "braces": "Braces",
+    "tooth taken out": "Tooth Taken Out",
+    "root canal/filling": "Root Canal/Filling",
+    "implant": "Implant",
+    "tooth fracture": "Tooth Fracture",
+    "prosthesis fitted": "Prosthesis Fitted",
+}
+
+# Per canonical treatment: lower-cased subtype variants -> canonical subtype
+# (mirrors Flutter AppState._canonicalSubtype).
+_SUBTYPE_ALIASES: Dict[str, Dict[str, str]] = {
+    "Prosthesis Fitted": {
+        **dict.fromkeys(("fixed", "fixed denture", "fixed dentures"), "Fixed Dentures"),
+        **dict.fromkeys(("removable", "removable denture", "removable dentures"), "Removable Dentures"),
+    },
+    "Implant": {
+        "first stage": "First Stage",
+        "second stage": "Second Stage",
+    },
+    "Tooth Fracture": {
+        # Common variants
+        **dict.fromkeys(("teeth cleaning", "cleaning"), "Teeth Cleaning"),
+        **dict.fromkeys(("teeth whitening", "whitening"), "Teeth Whitening"),
+        "gum surgery": "Gum Surgery",
+        **dict.fromkeys(("veneers", "laminates", "veneers/laminates", "veneers laminates"), "Veneers/Laminates"),
+    },
+}
 
 
 def _canonical_treatment(value: Optional[str]) -> str:
     raw = (value or "").strip()
     if not raw:
         return ""
-    s = raw.lower()
-    # Back-compat aliases (mirrors Flutter AppState._canonicalTreatment)
-    if s == "prosthesis":
-        return "Prosthesis Fitted"
-    # Case-insensitive normalization for known treatments in this catalog
-    known = {
-        "braces": "Braces",
-        "tooth taken out": "Tooth Taken Out",
-        "root canal/filling": "Root Canal/Filling",
-        "implant": "Implant",
-        "tooth fracture": "Tooth Fracture",
-        "prosthesis fitted": "Prosthesis Fitted",
-    }
-    return known.get(s, raw)
+    return _TREATMENT_ALIASES.get(raw.lower(), raw)
 
 
 def _canonical_subtype(treatment: Optional[str], value: Optional[str]) -> str:
@@ -30,32 +65,9 @@ def _canonical_subtype(treatment: Optional[str], value: Optional[str]) -> str:
     raw = (value or "").strip()
     if not raw:
         return ""
-    s = raw.lower()
-
-    # Mirrors Flutter AppState._canonicalSubtype for Prosthesis
-    if t == "Prosthesis Fitted":
-        if s in {"fixed", "fixed denture", "fixed dentures"}:
-            return "Fixed Dentures"
-        if s in {"removable", "removable denture", "removable dentures"}:
-            return "Removable Dentures"
-
-    if t == "Implant":
-        if s in {"first stage"}:
-            return "First Stage"
-        if s in {"second stage"}:
-            return "Second Stage"
-
-    if t == "Tooth Fracture":
-        # Common variants
-        if s in {"teeth cleaning", "cleaning"}:
-            return "Teeth Cleaning"
-        if s in {"teeth whitening", "whitening"}:
-            return "Teeth Whitening"
-        if s in {"gum surgery"}:
-            return "Gum Surgery"
-        if s in {"veneers", "laminates", "veneers/laminates", "veneers laminates"}:
-            return "Veneers/Laminates"
-
+    aliases = _SUBTYPE_ALIASES.get(t)
+    if aliases:
+        return aliases.get(raw.lower(), raw)
     return raw
 
 
@@ -63,18 +75,24 @@ def canonical_group(value: Optional[str]) -> str:
     return (value or "").strip().lower()
 
 
-def canonical_instruction_text(value: Optional[str]) -> str:
+@lru_cache(maxsize=_CACHE_SIZE)
+def _canonical_instruction_text(s: str) -> str:
     # Mirrors Flutter AppState._canonicalInstructionText
-    s = (value or "").strip()
+    s = s.strip()
     # When extracting from source-like content, we may have literal escape sequences.
     # The app sees real newlines at runtime, which then get whitespace-collapsed.
     s = s.replace("\\n", " ")
-    s = re.sub(r"\s+", " ", s)
+    s = _WHITESPACE_RE.sub(" ", s)
     s = s.replace("\u2013", "-")  # –
     s = s.replace("\u2014", "-")  # —
     return s
 
 
+def canonical_instruction_text(value: Optional[str]) -> str:
+    return _canonical_instruction_text(value or "")
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
 def stable_instruction_index(group: str, instruction: str) -> int:
     """Matches Flutter AppState.stableInstructionIndex (FNV-1a 32-bit, positive int)."""
     s = (group.strip().lower() + "|" + instruction.strip().lower())
@@ -86,6 +104,15 @@ def stable_instruction_index(group: str, instruction: str) -> int:
     return h & 0x7FFFFFFF
 
 
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters for the memoized helpers (diagnostics)."""
+    out: Dict[str, Dict[str, int]] = {}
+    for name, fn in (("canonical_instruction_text", _canonical_instruction_text), ("stable_instruction_index", stable_instruction_index)):
+        info = fn.cache_info()
+        out[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize or 0}
+    return out
+
+
 # Canonical instruction catalog extracted from the Flutter instruction screens.
 # This catalog includes ONLY checkable/logged instructions:
 #   - group='general' and group='specific'
@@ -264,6 +291,50 @@ _CATALOG: Dict[Tuple[str, Optional[str]], Dict[str, List[str]]] = {
 }
 
 
+def _build_index() -> "MappingProxyType[Tuple[str, Optional[str]], MappingProxyType]":
+    """Canonical (treatment, subtype) -> read-only {(group, instruction_index): metadata}."""
+    index = {}
+    for (t, s), groups in _CATALOG.items():
+        identities = {}
+        for group, items in groups.items():
+            g = canonical_group(group)
+            for raw_text in items:
+                text = canonical_instruction_text(raw_text)
+                idx = stable_instruction_index(g, text)
+                identities[(g, idx)] = MappingProxyType({
+                    "group": g,
+                    "instruction_index": idx,
+                    "instruction_text": text,
+                    "treatment": t,
+                    "subtype": s,
+                })
+        index[(t, s)] = MappingProxyType(identities)
+    return MappingProxyType(index)
+
+
+def _index_version(index) -> str:
+    """Short content hash of the index; changes whenever any catalog entry changes."""
+    payload = sorted(
+        [t, s or "", g, idx, meta["instruction_text"]]
+        for (t, s), identities in index.items()
+        for (g, idx), meta in identities.items()
+    )
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+# Built once at import; the catalog is static for the life of the process.
+_INDEX = _build_index()
+CATALOG_VERSION = _index_version(_INDEX)
+
+
+def catalog_info() -> Dict[str, object]:
+    return {
+        "version": CATALOG_VERSION,
+        "treatments": len(_INDEX),
+        "instructions": sum(len(v) for v in _INDEX.values()),
+    }
+
+
 def get_expected_instructions(treatment: Optional[str], subtype: Optional[str]) -> Optional[Dict[str, List[str]]]:
     """Returns a dict of groups -> instruction texts, or None if unknown."""
     t = _canonical_treatment(treatment)
@@ -276,30 +347,12 @@ def expected_instruction_identities(
     *,
     treatment: Optional[str],
     subtype: Optional[str],
-) -> Optional[Dict[tuple, Dict[str, object]]]:
+) -> Optional[Mapping[tuple, Mapping[str, object]]]:
     """Returns expected identities keyed by (group, instruction_index).
 
     Each value contains: group, instruction_index, instruction_text, treatment, subtype.
+    The result is a shared read-only view from the import-time index; do not mutate.
     """
-    instrs = get_expected_instructions(treatment, subtype)
-    if not instrs:
-        return None
-
-    t = _canonical_treatment(treatment) or (treatment or "")
+    t = _canonical_treatment(treatment)
     s = _canonical_subtype(t, subtype)
-    subtype_out: Optional[str] = s if s else None
-
-    out: Dict[tuple, Dict[str, object]] = {}
-    for group, items in instrs.items():
-        g = canonical_group(group)
-        for raw_text in items:
-            text = canonical_instruction_text(raw_text)
-            idx = stable_instruction_index(g, text)
-            out[(g, idx)] = {
-                "group": g,
-                "instruction_index": idx,
-                "instruction_text": text,
-                "treatment": t,
-                "subtype": subtype_out,
-            }
-    return out
+    return _INDEX.get((t, s if s else None)) or None
@@ -0,0 +1,135 @@
+"""Instruction text dictionary for instruction_status.
+
+The same instruction texts are repeated for every patient and every day. Texts
+are stored once in instruction_dictionary, keyed by (group, instruction_index),
+where instruction_index is the app's stable FNV-1a identity
+(instruction_catalog.stable_instruction_index). instruction_status rows whose
+text equals the dictionary entry store NULL instead of the text.
+
+Reads need no changes: models.InstructionStatus.instruction_text is a
+COALESCE(stored, dictionary) column_property. Core statements that only see
+the stored column (e.g. upsert RETURNING) use expand() with the in-process
+cache kept here.
+
+Texts that differ from the first one recorded for a key stay inline, so every
+row round-trips exactly. Older databases where instruction_status.instruction_text
+is still NOT NULL (SQLite cannot drop the constraint) keep storing inline text;
+startup calls set_enabled() with the detected nullability.
+"""
+
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# (group, instruction_index) -> text, for entries known to exist in the table.
+_cache: dict[tuple[str, int], str] = {}
+_enabled = True
+
+
+def set_enabled(value: bool) -> None:
+    global _enabled
+    _enabled = bool(value)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def lookup(group: str, instruction_index: int) -> Optional[str]:
+    return _cache.get((group, int(instruction_index)))
+
+
+def expand(group: str, instruction_index: int, stored_text: Optional[str]) -> Optional[str]:
+    """Return stored_text, or the dictionary text when the row stores NULL."""
+    if stored_text is not None:
+        return stored_text
+    return lookup(group, instruction_index)
+
+
+def _insert_for(db: AsyncSession):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+async def ensure(db: AsyncSession, entries: Iterable[tuple[str, int, str]]) -> None:
+    """Make sure dictionary rows exist for entries (group, index, text); first text wins."""
+    missing: dict[tuple[str, int], str] = {}
+    for group, idx, txt in entries:
+        key = (group, int(idx))
+        if key not in _cache and key not in missing and txt is not None:
+            missing[key] = txt
+    if not missing:
+        return
+    table = models.InstructionDictionary.__table__
+    stmt = _insert_for(db)(table).values([
+        {"group": g, "instruction_index": i, "instruction_text": t} for (g, i), t in missing.items()
+    ]).on_conflict_do_nothing(index_elements=[table.c.group, table.c.instruction_index])
+    await db.execute(stmt)
+    # Another writer may have won the insert; cache whatever text is actually stored.
+    res = await db.execute(
+        select(table.c.group, table.c.instruction_index, table.c.instruction_text)
+        .where(tuple_(table.c.group, table.c.instruction_index).in_(list(missing)))
+    )
+    for g, i, t in res.all():
+        _cache[(g, int(i))] = t
+
+
+async def load(db: AsyncSession) -> int:
+    """Warm the cache with the whole dictionary (it is small: one row per distinct instruction)."""
+    table = models.InstructionDictionary.__table__
+    res = await db.execute(select(table.c.group, table.c.instruction_index, table.c.instruction_text))
+    for g, i, t in res.all():
+        _cache[(g, int(i))] = t
+    return len(_cache)
+
+
+def stored_value(group: str, instruction_index: int, instruction_text: str) -> Optional[str]:
+    """Value to write into instruction_status.instruction_text for this item."""
+    if _enabled and lookup(group, instruction_index) == instruction_text:
+        return None
+    return instruction_text
+
+
+async def compact(db: AsyncSession, *, batch_size: int = 5000, max_batches: int = 200) -> dict[str, Any]:
+    """Move inline texts of existing rows into the dictionary; commits per batch.
+
+    updated_at is left untouched: the visible text does not change, so delta sync
+    must not report these rows.
+    """
+    if not _enabled:
+        return {"ok": False, "error": "instruction_status.instruction_text is NOT NULL; dictionary disabled"}
+    seeded = await db.execute(text(
+        """
+        INSERT INTO instruction_dictionary ("group", instruction_index, instruction_text, created_at)
+        SELECT "group", instruction_index, MIN(instruction_text), CURRENT_TIMESTAMP
+        FROM instruction_status
+        WHERE instruction_text IS NOT NULL
+        GROUP BY "group", instruction_index
+        ON CONFLICT ("group", instruction_index) DO NOTHING
+        """
+    ))
+    await db.commit()
+    compacted = 0
+    for _ in range(max(1, max_batches)):
+        res = await db.execute(text(
+            """
+            UPDATE instruction_status SET instruction_text = NULL
+            WHERE id IN (
+              SELECT s.id FROM instruction_status s
+              JOIN instruction_dictionary d
+                ON d."group" = s."group" AND d.instruction_index = s.instruction_index
+               AND d.instruction_text = s.instruction_text
+              LIMIT :batch
+            )
+            """
+        ), {"batch": batch_size})
+        await db.commit()
+        n = int(res.rowcount or 0)
+        compacted += n
+        if n < batch_size:
+            break
+    entries = await load(db)
+    return {"ok": True, "dictionary_inserted": int(seeded.rowcount or 0), "rows_compacted": compacted, "dictionary_entries": entries}
@@ -0,0 +1,224 @@
+"""Dialect-portable bulk upsert for instruction_status rows.
+
+Postgres (production) and SQLite (local test.db fallback) both support
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING; only the insert construct and
+the timestamp function differ. This module picks the right one from the
+session's bind so save_instruction_status runs unchanged on either backend.
+
+Semantics (same as the original hand-written SQL):
+  * Conflict target is ux_instruction_identity (patient_id, date, group, instruction_index).
+  * treatment/subtype/instruction_text/followed are overwritten by the new values.
+  * ever_followed is sticky: existing OR new, so once true it never reverts.
+  * Rows whose followed/instruction_text/treatment/subtype already match are left
+    untouched (no write, updated_at/change_seq not bumped) so /instruction-status/changes
+    only reports real changes. Stored rows are read first, so those items are never
+    sent to the upsert and are flagged unchanged.
+  * Texts already in instruction_dictionary are stored as NULL (see instruction_dictionary).
+  * Every written row gets a fresh change_seq from patients.instruction_change_seq.
+    Allocating it updates the patient row, so on Postgres concurrent writers for one
+    patient serialize on that row lock and commit in change_seq order; a reader
+    paging /instruction-status/changes by change_seq therefore never skips a row.
+"""
+
+from types import SimpleNamespace
+from typing import Any, Iterable
+
+from sqlalchemy import func, literal_column, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import instruction_dictionary
+import models
+
+# Rows per statement. Each row binds ~9 params, keeping us far below
+# Postgres' 32767 and SQLite's 32766 bind parameter limits.
+DEFAULT_CHUNK_SIZE = 500
+
+_CONFLICT_COLUMNS = ("patient_id", "date", "group", "instruction_index")
+
+
+def _insert_for(db: AsyncSession):
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert
+    if name == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"instruction_status upsert not supported for dialect '{name}'")
+
+
+def build_upsert(db: AsyncSession, values: list[dict[str, Any]]):
+    """Return the multi-row INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement."""
+    table = models.InstructionStatus.__table__
+    insert = _insert_for(db)
+    stmt = insert(table).values(values)
+    excluded = stmt.excluded
+    dictionary = models.InstructionDictionary.__table__
+    # Text as clients see it: NULL means "the dictionary entry for (group, index)".
+    # The target row is referenced by name: an INSERT gives the subquery nothing to correlate with.
+    dictionary_text = (
+        select(dictionary.c.instruction_text)
+        .where(
+            dictionary.c.group == literal_column('instruction_status."group"'),
+            dictionary.c.instruction_index == literal_column("instruction_status.instruction_index"),
+        )
+        .scalar_subquery()
+    )
+    stmt = stmt.on_conflict_do_update(
+        # No-op suppression: only rewrite when a client-visible field differs.
+        where=or_(
+            table.c.followed.is_distinct_from(excluded.followed),
+            func.coalesce(table.c.instruction_text, dictionary_text).is_distinct_from(
+                func.coalesce(excluded.instruction_text, dictionary_text)
+            ),
+            table.c.treatment.is_distinct_from(excluded.treatment),
+            table.c.subtype.is_distinct_from(excluded.subtype),
+        ),
+        index_elements=[table.c[name] for name in _CONFLICT_COLUMNS],
+        set_={
+            "treatment": excluded.treatment,
+            "subtype": excluded.subtype,
+            "instruction_text": excluded.instruction_text,
+            "followed": excluded.followed,
+            "ever_followed": or_(table.c.ever_followed, excluded.ever_followed),
+            "updated_at": func.now(),
+            "change_seq": excluded.change_seq,
+        },
+    )
+    return stmt.returning(*_returned_columns(table))
+
+
+def _returned_columns(table) -> tuple:
+    return (
+        table.c.id,
+        table.c.patient_id,
+        table.c.date,
+        table.c.treatment,
+        table.c.subtype,
+        table.c.group,
+        table.c.instruction_index,
+        table.c.instruction_text,
+        table.c.followed,
+        table.c.ever_followed,
+        table.c.updated_at,
+        table.c.change_seq,
+    )
+
+
+def _expanded(row: Any) -> SimpleNamespace:
+    """Row as an attribute object with instruction_text filled from the dictionary."""
+    data = dict(row._mapping)
+    data["instruction_text"] = instruction_dictionary.expand(data["group"], data["instruction_index"], data["instruction_text"])
+    return SimpleNamespace(**data)
+
+
+async def allocate_change_seq(db: AsyncSession, patient_id: int, count: int) -> int:
+    """Reserve `count` change sequence numbers for patient_id; returns the first one."""
+    patients = models.Patient.__table__
+    res = await db.execute(
+        update(patients)
+        .where(patients.c.id == patient_id)
+        .values(instruction_change_seq=patients.c.instruction_change_seq + count)
+        .returning(patients.c.instruction_change_seq)
+    )
+    return int(res.scalar_one()) - count + 1
+
+
+def _row_values(patient_id: int, item: Any, change_seq: int) -> dict[str, Any]:
+    return {
+        "patient_id": patient_id,
+        "date": item.date,
+        "treatment": item.treatment or "",
+        "subtype": item.subtype,
+        "group": item.group,
+        "instruction_index": item.instruction_index,
+        "instruction_text": instruction_dictionary.stored_value(item.group, item.instruction_index, item.instruction_text),
+        "followed": item.followed,
+        "ever_followed": (item.followed is True),
+        "updated_at": func.now(),
+        "change_seq": change_seq,
+    }
+
+
+def _unchanged(stored: Any, item: Any, values: dict[str, Any]) -> bool:
+    """True when writing values would not change any client-visible field of stored.
+
+    Text is compared as clients see it: an older row holding the dictionary text
+    inline equals a new value stored as NULL.
+    """
+    return (
+        stored.followed == values["followed"]
+        and instruction_dictionary.expand(stored.group, stored.instruction_index, stored.instruction_text) == item.instruction_text
+        and stored.treatment == values["treatment"]
+        and stored.subtype == values["subtype"]
+    )
+
+
+async def _existing_rows(db: AsyncSession, patient_id: int, keys: list[tuple]) -> dict[tuple, Any]:
+    table = models.InstructionStatus.__table__
+    res = await db.execute(
+        select(*_returned_columns(table))
+        .where(table.c.patient_id == patient_id)
+        .where(tuple_(table.c.date, table.c.group, table.c.instruction_index).in_(keys))
+    )
+    return {(row.date, row.group, row.instruction_index): row for row in res.all()}
+
+
+async def upsert_instruction_statuses(
+    db: AsyncSession,
+    patient_id: int,
+    items: Iterable[Any],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> list[tuple[Any, bool]]:
+    """Upsert items (InstructionStatusItem-like) for one patient; does not commit.
+
+    Items should already be collapsed to one per (date, group, instruction_index).
+    Returns (row, changed) pairs in the same order as `items`; changed is False when
+    the stored row already matched and was skipped.
+
+    Stored rows are read first and only items that differ are written, so a resend
+    of an unchanged checklist neither touches the patients row nor consumes
+    change_seq numbers. The ON CONFLICT guard still covers concurrent writers.
+    """
+    items = list(items)
+    rows_by_key: dict[tuple, Any] = {}
+    changed_keys: set[tuple] = set()
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        if instruction_dictionary.enabled():
+            await instruction_dictionary.ensure(db, [(i.group, i.instruction_index, i.instruction_text) for i in chunk])
+        keys = [(item.date, item.group, item.instruction_index) for item in chunk]
+        existing = await _existing_rows(db, patient_id, keys)
+        pending = []
+        for key, item in zip(keys, chunk):
+            values = _row_values(patient_id, item, 0)
+            stored = existing.get(key)
+            if stored is not None and _unchanged(stored, item, values):
+                rows_by_key[key] = _expanded(stored)
+            else:
+                pending.append(values)
+        if not pending:
+            continue
+        first_seq = await allocate_change_seq(db, patient_id, len(pending))
+        for n, values in enumerate(pending):
+            values["change_seq"] = first_seq + n
+        res = await db.execute(build_upsert(db, pending))
+        for row in res.all():
+            row = _expanded(row)
+            key = (row.date, row.group, row.instruction_index)
+            rows_by_key[key] = row
+            changed_keys.add(key)
+        # Rows a concurrent writer already brought up to date are suppressed by the
+        # guard and not RETURNed; read them back as they are.
+        missing = [k for k in keys if k not in rows_by_key]
+        if missing:
+            for key, row in (await _existing_rows(db, patient_id, missing)).items():
+                rows_by_key[key] = _expanded(row)
+    # RETURNING order is not guaranteed; answer in input order.
+    out = []
+    for item in items:
+        key = (item.date, item.group, item.instruction_index)
+        row = rows_by_key.get(key)
+        if row is not None:
+            out.append((row, key in changed_keys))
+    return out
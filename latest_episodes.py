@@ -0,0 +1,91 @@
+"""patient_latest_episodes: each patient's latest episode with a non-empty treatment.
+
+Doctor dashboards (/patients/by-doctor) need, per patient, the newest
+treatment_episodes row whose treatment is set. Computing it with
+row_number() OVER (PARTITION BY patient_id ORDER BY id DESC) scans every
+episode the panel ever had; this table keeps the answer keyed by patient_id.
+
+Maintenance: refresh(db, patient_ids) recomputes the rows for those patients
+inside the caller's transaction (no commit). It is called from
+_mirror_episode_to_patient (which every episode write path ends with), from
+_get_or_create_open_episode when it auto-locks, and from the rotation sweeper.
+rebuild() recomputes everything (startup when the table is empty, ops task).
+"""
+
+from typing import Any, Iterable
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# Episode columns copied into the summary, in summary-column order.
+_COPIED = (
+    "department", "doctor", "doctor_id", "treatment", "subtype",
+    "procedure_date", "procedure_time", "procedure_completed", "locked",
+)
+_IN_CHUNK = 1000
+
+
+def _latest_query(patient_ids: list[int] | None):
+    ep = models.TreatmentEpisode
+    ranked = select(
+        ep.patient_id.label("patient_id"),
+        ep.id.label("episode_id"),
+        *[getattr(ep, c).label(c) for c in _COPIED],
+        func.row_number().over(partition_by=ep.patient_id, order_by=ep.id.desc()).label("rn"),
+    ).where(ep.treatment.is_not(None), ep.treatment != "")
+    if patient_ids is not None:
+        ranked = ranked.where(ep.patient_id.in_(patient_ids))
+    ranked = ranked.subquery()
+    return select(ranked.c.patient_id, ranked.c.episode_id, *[ranked.c[c] for c in _COPIED]).where(ranked.c.rn == 1)
+
+
+def _insert_for(db: AsyncSession):
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+async def _store(db: AsyncSession, rows: list[Any]) -> None:
+    if not rows:
+        return
+    table = models.PatientLatestEpisode.__table__
+    stmt = _insert_for(db)(table).values([
+        {**dict(r._mapping), "updated_at": func.now()} for r in rows
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.patient_id],
+        set_={c: stmt.excluded[c] for c in ("episode_id", *_COPIED, "updated_at")},
+    )
+    await db.execute(stmt)
+
+
+async def refresh(db: AsyncSession, patient_ids: Iterable[int]) -> None:
+    """Recompute the summary rows for patient_ids (index lookups per patient); no commit."""
+    ids = sorted({int(p) for p in patient_ids})
+    table = models.PatientLatestEpisode.__table__
+    for start in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[start:start + _IN_CHUNK]
+        rows = (await db.execute(_latest_query(chunk))).all()
+        await _store(db, rows)
+        # Patients whose episodes all lost their treatment drop out.
+        have = {int(r.patient_id) for r in rows}
+        gone = [pid for pid in chunk if pid not in have]
+        if gone:
+            await db.execute(delete(table).where(table.c.patient_id.in_(gone)))
+
+
+async def rebuild(db: AsyncSession) -> int:
+    """Recompute the whole table from treatment_episodes; commits."""
+    table = models.PatientLatestEpisode.__table__
+    rows = (await db.execute(_latest_query(None))).all()
+    await db.execute(delete(table))
+    for start in range(0, len(rows), _IN_CHUNK):
+        await _store(db, rows[start:start + _IN_CHUNK])
+    await db.commit()
+    return len(rows)
+
+
+async def is_empty(db: AsyncSession) -> bool:
+    table = models.PatientLatestEpisode.__table__
+    return (await db.execute(select(table.c.patient_id).limit(1))).first() is None
@@ -1,8 +1,11 @@
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, time as dt_time
 import traceback
 import os
-from typing import List, Optional, Any
-from pydantic import BaseModel
+import json
+import hashlib
+import base64
+from typing import List, Optional, Any, AsyncIterator
+from pydantic import BaseModel, TypeAdapter
 import asyncio  # moved here so exception handlers can reference
 
 import models
@@ -15,18 +18,30 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, delete
+from sqlalchemy import select, text, delete, insert, update
 from sqlalchemy.exc import IntegrityError
 
 import schemas
 from database import engine
 import instruction_catalog
+import instruction_dictionary
+import instruction_upsert
+import rate_limit
+import write_coalescer
+import idempotency
+import doctor_directory
+import latest_episodes
+import response_cache
+import patient_search
+import completed_episodes
+import fast_json
 
 from utils import send_registration_email, send_fcm_notification, send_fcm_notification_ex
 import os
-from fastapi import Request
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy import and_, or_, select
-from sqlalchemy import func
+from sqlalchemy import func, case, literal
 from datetime import datetime, timedelta
 import pytz
 from routes import auth
@@ -39,9 +54,6 @@ app = FastAPI()
 # Unverified signups are auto-pruned after this many hours (set env to 0/negative to disable)
 UNVERIFIED_SIGNUP_RETENTION_HOURS = int(os.getenv("UNVERIFIED_SIGNUP_RETENTION_HOURS", "24"))
 
-# In-memory rate limiter buckets for instruction status endpoint (patient_id -> list[timestamps])
-# NOTE: Single-process only. Replace with shared store (Redis) for multi-worker deployments.
-_instruction_rate_limiter: dict[int, list[float]] = {}
 
 # --- In-memory instrumentation for reminder fallback dispatch (non-persistent) ---
 # Updated each time /push/dispatch-due (or scheduler invoking dispatch_due_pushes) runs.
@@ -58,6 +70,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Replay stored responses for retried writes carrying an Idempotency-Key header.
+app.add_middleware(
+    idempotency.IdempotencyMiddleware,
+    paths=("/instruction-status", "/reminders/sync", "/progress", "/chat/thread"),
+)
+
 
 @app.on_event("startup")
 async def schedule_existing_unverified_cleanup() -> None:
@@ -97,6 +115,23 @@ async def healthz_head():
     # Some uptime monitors use HEAD. Mirror GET semantics.
     return await healthz()
 
+@app.get("/instruction-catalog/version")
+async def instruction_catalog_version():
+    """Version hash of the server's instruction catalog.
+
+    Changes whenever any catalog instruction changes, so clients and caches can
+    tell whether their expected-instruction data is stale.
+    """
+    return instruction_catalog.catalog_info()
+
+@app.get("/diag/cache")
+async def diag_cache():
+    """Hit/miss counters for the in-process caches (dashboard responses, instruction catalog)."""
+    return {
+        "dashboard": response_cache.dashboard_cache.stats(),
+        "instruction_catalog": instruction_catalog.cache_stats(),
+    }
+
 @app.get("/diag/echo")
 async def diag_echo():
     """Minimal fast diagnostic endpoint to verify service reachability and latency.
@@ -134,25 +169,49 @@ async def reminders_health(db: AsyncSession = Depends(get_db)):
         "active_reminders": total_active,
     }
 
+def _reminder_ops_row(r: Any) -> dict[str, Any]:
+    return {
+        "id": r.id,
+        "patient_id": r.patient_id,
+        "title": r.title,
+        "status": r.last_delivery_status,
+        "attempts_today": r.attempts_today,
+        "next_fire_utc": r.next_fire_utc.isoformat() if r.next_fire_utc else None,
+        "last_attempt_utc": r.last_attempt_utc.isoformat() if r.last_attempt_utc else None,
+    }
+
+
+def _reminder_ops_query(limit: int):
+    problematic_status = {"retry", "token_invalid", "failed_permanent"}
+    rm = models.Reminder
+    return (
+        select(rm.id, rm.patient_id, rm.title, rm.last_delivery_status, rm.attempts_today, rm.next_fire_utc, rm.last_attempt_utc)
+        .where(rm.last_delivery_status.in_(problematic_status))
+        .order_by(rm.last_attempt_utc.desc())
+        .limit(limit)
+    )
+
+
+async def _stream_reminder_ops(limit: int) -> AsyncIterator[dict[str, Any]]:
+    count = 0
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_reminder_ops_query(limit))
+        async for r in result:
+            count += 1
+            yield {"type": "reminder", **_reminder_ops_row(r)}
+    yield {"type": "summary", "count": count}
+
+
 @app.get("/reminders/debug-ops")
-async def reminders_debug_ops(limit: int = 50, db: AsyncSession = Depends(get_db)):
+async def reminders_debug_ops(limit: int = 50, stream: bool = False, db: AsyncSession = Depends(get_db)):
     """Return recently attempted reminders that are in retry/token_invalid/failed states.
     Intended for operational diagnostics.
+    With stream=1 the rows are sent as NDJSON (limit up to 100000) followed by a summary line.
     """
-    problematic_status = {"retry", "token_invalid", "failed_permanent"}
-    res = await db.execute(select(models.Reminder).where(models.Reminder.last_delivery_status.in_(problematic_status)).order_by(models.Reminder.last_attempt_utc.desc()))
-    rows = res.scalars().all()
-    out = []
-    for r in rows[:limit]:
-        out.append({
-            "id": object.__getattribute__(r,'id'),
-            "patient_id": getattr(r,'patient_id'),
-            "title": getattr(r,'title'),
-            "status": getattr(r,'last_delivery_status'),
-            "attempts_today": getattr(r,'attempts_today'),
-            "next_fire_utc": getattr(r,'next_fire_utc').isoformat() if getattr(r,'next_fire_utc') else None,
-            "last_attempt_utc": getattr(r,'last_attempt_utc').isoformat() if getattr(r,'last_attempt_utc') else None,
-        })
+    if stream:
+        return _ndjson_response(_stream_reminder_ops(max(0, min(limit, 100000))))
+    res = await db.execute(_reminder_ops_query(max(0, limit)))
+    out = [_reminder_ops_row(r) for r in res.all()]
     return {"count": len(out), "reminders": out}
 
 @app.get("/push/diag")
@@ -225,6 +284,30 @@ async def startup():
                 print(f"[Startup] WARNING could not ensure updated_at column/index: {mig_e}")
         except Exception as e:
             print(f"[Startup] InstructionStatus index init warning: {e}")
+        # --- Instruction dictionary: instruction_text must be nullable to reference dictionary entries ---
+        try:
+            text_nullable: Optional[bool] = None
+            try:
+                r = await conn.execute(text("SELECT is_nullable FROM information_schema.columns WHERE table_name='instruction_status' AND column_name='instruction_text';"))
+                row = r.first()
+                if row is not None:
+                    text_nullable = str(row[0]).upper() == "YES"
+                    if not text_nullable:
+                        print("[Startup] Dropping NOT NULL on instruction_status.instruction_text for the instruction dictionary …")
+                        await conn.execute(text("ALTER TABLE instruction_status ALTER COLUMN instruction_text DROP NOT NULL;"))
+                        text_nullable = True
+            except Exception:
+                # SQLite fallback (cannot drop NOT NULL in place; keep inline text on old files)
+                r = await conn.execute(text("PRAGMA table_info(instruction_status);"))
+                for col in r.fetchall():
+                    if col[1] == "instruction_text":
+                        text_nullable = not bool(col[3])
+            instruction_dictionary.set_enabled(text_nullable is not False)
+            if text_nullable is False:
+                print("[Startup] instruction_status.instruction_text is NOT NULL; instruction dictionary disabled")
+        except Exception as dict_mig_e:
+            instruction_dictionary.set_enabled(False)
+            print(f"[Startup] instruction dictionary migration note: {dict_mig_e}")
         # --- Lightweight online migrations for new push/reminder columns ---
         try:
             # DeviceToken lifecycle columns
@@ -312,6 +395,14 @@ async def startup():
                 p_alter.append("ALTER TABLE patients ADD COLUMN last_completed_episode_id INTEGER NULL;")
             if 'last_completed_at' not in patients_cols:
                 p_alter.append("ALTER TABLE patients ADD COLUMN last_completed_at TIMESTAMP WITHOUT TIME ZONE NULL;")
+            if 'rotation_due_on' not in patients_cols:
+                # NULL for existing rows: the first _rotate_if_due call computes it.
+                p_alter.append("ALTER TABLE patients ADD COLUMN rotation_due_on DATE NULL;")
+            if patients_cols and 'instruction_change_seq' not in patients_cols:
+                p_alter.append("ALTER TABLE patients ADD COLUMN instruction_change_seq BIGINT DEFAULT 0 NOT NULL;")
+            if patients_cols and 'doctor_id' not in patients_cols:
+                p_alter.append("ALTER TABLE patients ADD COLUMN doctor_id INTEGER NULL REFERENCES doctors(id) ON DELETE SET NULL;")
+            p_alter.append("CREATE INDEX IF NOT EXISTS ix_patients_doctor_id ON patients (doctor_id);")
 
             for stmt in p_alter:
                 try:
@@ -321,6 +412,80 @@ async def startup():
         except Exception as p_mig_all:
             print(f"[Startup] WARNING patients migration block failed: {p_mig_all}")
 
+        # --- instruction_status.change_seq (cursor for /instruction-status/changes) ---
+        try:
+            is_cols: set[str] = set()
+            try:
+                icols = await conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name='instruction_status';"))
+                is_cols = {r[0] for r in icols.fetchall()}
+            except Exception:
+                try:
+                    icols = await conn.execute(text("PRAGMA table_info(instruction_status);"))
+                    is_cols = {r[1] for r in icols.fetchall()}
+                except Exception:
+                    is_cols = set()
+            if is_cols and 'change_seq' not in is_cols:
+                print("[Startup] Adding instruction_status.change_seq and backfilling from id …")
+                await conn.execute(text("ALTER TABLE instruction_status ADD COLUMN change_seq BIGINT NULL;"))
+                # ids are increasing, so they are a valid per-patient order for existing rows.
+                await conn.execute(text("UPDATE instruction_status SET change_seq = id WHERE change_seq IS NULL;"))
+                await conn.execute(text(
+                    """
+                    UPDATE patients SET instruction_change_seq = COALESCE(
+                      (SELECT MAX(s.change_seq) FROM instruction_status s WHERE s.patient_id = patients.id), 0
+                    );
+                    """
+                ))
+                print("[Startup] instruction_status.change_seq added.")
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_instruction_status_patient_change_seq ON instruction_status (patient_id, change_seq);"
+            ))
+        except Exception as seq_mig_e:
+            print(f"[Startup] instruction_status.change_seq migration note: {seq_mig_e}")
+
+        # --- treatment_episodes.updated_at (ETag validator for /episodes/history) ---
+        try:
+            ep_cols: set[str] = set()
+            try:
+                ecols = await conn.execute(text("SELECT column_name FROM information_schema.columns WHERE table_name='treatment_episodes';"))
+                ep_cols = {r[0] for r in ecols.fetchall()}
+            except Exception:
+                try:
+                    ecols = await conn.execute(text("PRAGMA table_info(treatment_episodes);"))
+                    ep_cols = {r[1] for r in ecols.fetchall()}
+                except Exception:
+                    ep_cols = set()
+            if ep_cols and 'updated_at' not in ep_cols:
+                await conn.execute(text("ALTER TABLE treatment_episodes ADD COLUMN updated_at TIMESTAMP WITHOUT TIME ZONE NULL;"))
+                await conn.execute(text("UPDATE treatment_episodes SET updated_at = created_at WHERE updated_at IS NULL;"))
+                print("[Startup] treatment_episodes.updated_at added.")
+            if ep_cols and 'doctor_id' not in ep_cols:
+                # Filled from the free-text doctor names by doctor_directory.backfill() below.
+                await conn.execute(text("ALTER TABLE treatment_episodes ADD COLUMN doctor_id INTEGER NULL REFERENCES doctors(id) ON DELETE SET NULL;"))
+                print("[Startup] treatment_episodes.doctor_id added.")
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_treatment_episodes_doctor_id ON treatment_episodes (doctor_id);"))
+            # Keyset pages of /patients/by-doctor-episodes (sort=recent walks this index directly).
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_treatment_episodes_doctor_id_id ON treatment_episodes (doctor_id, id);"))
+            # sort=procedure_date: must match _doctor_episode_sort_keys' coalesce() expression exactly.
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_treatment_episodes_doctor_id_procedure_date "
+                "ON treatment_episodes (doctor_id, coalesce(procedure_date, '0001-01-01'), id);"
+            ))
+        except Exception as ep_upd_e:
+            print(f"[Startup] treatment_episodes.updated_at migration note: {ep_upd_e}")
+
+        # --- Partial index for the episode rotation sweeper (open + completed episodes by date) ---
+        try:
+            dialect_name = getattr(getattr(engine, "dialect", None), "name", "") or ""
+            rot_where = "locked = FALSE AND procedure_completed = TRUE"
+            if dialect_name.lower() == "sqlite":
+                rot_where = "locked = 0 AND procedure_completed = 1"
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_treatment_episodes_rotation_due ON treatment_episodes (procedure_date) WHERE {rot_where};"
+            ))
+        except Exception as rot_idx_e:
+            print(f"[Startup] rotation index migration note: {rot_idx_e}")
+
         # --- Read-only view: completed_patients (one row per completed+locked episode) ---
         # This view intentionally allows multiple rows with the same email/phone/etc.
         # because it represents historical procedures (episodes), not unique accounts.
@@ -359,6 +524,38 @@ async def startup():
                 await conn.execute(text(f"CREATE OR REPLACE VIEW completed_patients AS {view_body}"))
         except Exception as view_mig_e:
             print(f"[Startup] completed_patients view migration note: {view_mig_e}")
+    try:
+        async with AsyncSessionLocal() as _session:
+            n = await instruction_dictionary.load(_session)
+        print(f"[Startup] Instruction dictionary loaded ({n} entries, enabled={instruction_dictionary.enabled()})")
+    except Exception as dict_load_e:
+        print(f"[Startup] instruction dictionary load note: {dict_load_e}")
+    try:
+        async with engine.begin() as conn:
+            mode = await patient_search.ensure_indexes(conn)
+        print(f"[Startup] patient search backend: {mode}")
+    except Exception as search_e:
+        print(f"[Startup] patient search index note: {search_e}")
+    try:
+        async with AsyncSessionLocal() as _session:
+            if await latest_episodes.is_empty(_session):
+                n = await latest_episodes.rebuild(_session)
+                print(f"[Startup] patient_latest_episodes built ({n} rows)")
+    except Exception as latest_e:
+        print(f"[Startup] patient_latest_episodes build note: {latest_e}")
+    try:
+        async with AsyncSessionLocal() as _session:
+            n = await completed_episodes.sync_missing(_session)
+        if n:
+            print(f"[Startup] completed_patient_episodes: added {n} missing rows")
+    except Exception as completed_e:
+        print(f"[Startup] completed_patient_episodes sync note: {completed_e}")
+    try:
+        async with AsyncSessionLocal() as _session:
+            res = await doctor_directory.backfill(_session)
+        print(f"[Startup] doctor_id backfill: {res}")
+    except Exception as doc_bf_e:
+        print(f"[Startup] doctor_id backfill note: {doc_bf_e}")
     if os.getenv("SCHEDULER_ENABLED", "1") == "1":
         print("[Startup] Scheduler enabled (SCHEDULER_ENABLED=1)")
         scheduler = AsyncIOScheduler()
@@ -433,12 +630,36 @@ async def startup():
             print(f"[Startup] Adherence interval set to {adh_interval_sec}s (ADHERENCE_INTERVAL_SEC)")
             scheduler.add_job(_run_adherence, IntervalTrigger(seconds=adh_interval_sec), id="adherence_nudge", replace_existing=True)
 
+        # Episode rotation sweeper: rotates due episodes in bulk so requests rarely have to.
+        if os.getenv("EPISODE_ROTATION_SWEEP_ENABLED", "1").lower() in {"1", "true", "yes", "on"}:
+            async def _run_rotation_sweep():
+                try:
+                    res = await _internal_sweep_episode_rotation()
+                    if res.get("rotated"):
+                        print(f"[Scheduler][rotation] {res}")
+                except Exception as e:
+                    print(f"[Scheduler] rotation sweep internal error: {e}")
+
+            try:
+                rot_interval_sec = int(os.getenv("EPISODE_ROTATION_SWEEP_INTERVAL_SEC", "900"))
+            except Exception:
+                rot_interval_sec = 900
+            if rot_interval_sec < 60:
+                rot_interval_sec = 60
+            print(f"[Startup] Episode rotation sweep interval set to {rot_interval_sec}s (EPISODE_ROTATION_SWEEP_INTERVAL_SEC)")
+            scheduler.add_job(_run_rotation_sweep, IntervalTrigger(seconds=rot_interval_sec), id="episode_rotation_sweep", replace_existing=True)
+
         scheduler.start()
     else:
         print("[Startup] Scheduler disabled via SCHEDULER_ENABLED env var")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Persist any buffered instruction-status writes before the process exits.
+    try:
+        await write_coalescer.instruction_coalescer.flush_all()
+    except Exception as e:
+        print(f"[Shutdown] WARNING coalescer flush failed: {e}")
     # Attempt graceful scheduler shutdown if running
     try:
         from apscheduler.schedulers.asyncio import AsyncIOScheduler as _S
@@ -785,34 +1006,14 @@ async def _internal_send_adherence_nudges(db: AsyncSession) -> dict[str, Any]:
     return {"enabled": True, "evaluated": evaluated, "nudged": nudged, "skipped": skipped, "errors": errors}
 
 
-async def _internal_preview_adherence_nudges(
-    db: AsyncSession,
-    *,
-    max_patients: int = 200,
-    sample: int = 50,
-) -> dict[str, Any]:
-    """Dry-run preview for adherence nudges.
-
-    This does NOT send push notifications and does NOT write to AdherenceNudge.
-    Intended for ops/debug to verify config + eligibility quickly.
-    """
-    now_utc = datetime.utcnow()
-
-    enabled = os.getenv("ADHERENCE_NUDGE_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+ADHERENCE_PREVIEW_MAX_PATIENTS = 5000
+# Streaming mode holds at most one page of patients in memory, so it can cover the whole population.
+ADHERENCE_PREVIEW_STREAM_MAX_PATIENTS = 100000
+ADHERENCE_PREVIEW_PAGE_SIZE = 500
 
-    def _normalize_procedure_date(value: Any) -> date | None:
-        if value is None:
-            return None
-        if isinstance(value, datetime):
-            return value.date()
-        if isinstance(value, date):
-            return value
-        try:
-            s = str(value)
-            return date.fromisoformat(s[:10])
-        except Exception:
-            return None
 
+def _adherence_preview_config(max_patients: int, sample: int, *, max_cap: int = ADHERENCE_PREVIEW_MAX_PATIENTS) -> dict[str, Any]:
+    """Resolve adherence nudge settings (env) + preview limits into one config dict."""
     # Allow a range of hours (e.g. "8,9") for morning windows.
     hours_raw = os.getenv("ADHERENCE_NUDGE_LOCAL_HOURS")
     allowed_hours: set[int]
@@ -861,6 +1062,61 @@ async def _internal_preview_adherence_nudges(
         ok_enabled_raw = os.getenv("ADHERENCE_OK_ENABLED", "0")
     ok_enabled = str(ok_enabled_raw).lower() in {"1", "true", "yes", "on"}
 
+    max_patients = int(max_patients)
+    sample = int(sample)
+    if max_patients < 1:
+        max_patients = 1
+    if max_patients > max_cap:
+        max_patients = max_cap
+    if sample < 0:
+        sample = 0
+    if sample > max_patients:
+        sample = max_patients
+
+    return {
+        "allowed_hours": sorted(list(allowed_hours)),
+        "minute_window": minute_window,
+        "threshold": threshold,
+        "max_days_after_procedure": max_days_after,
+        "default_tz": default_tz,
+        "ok_enabled": ok_enabled,
+        "max_patients": max_patients,
+        "sample": sample,
+    }
+
+
+async def _iter_adherence_preview(
+    db: AsyncSession,
+    config: dict[str, Any],
+    now_utc: datetime,
+) -> AsyncIterator[dict[str, Any]]:
+    """Evaluate adherence nudge eligibility one patient at a time (dry run).
+
+    Patients are read in keyset pages of (id, procedure_date) so memory stays flat
+    regardless of max_patients. Yields one evaluation dict per patient; adherence_*
+    fields are None when the patient was skipped before adherence was computed.
+    """
+    allowed_hours = set(config["allowed_hours"])
+    minute_window = config["minute_window"]
+    threshold = config["threshold"]
+    max_days_after = config["max_days_after_procedure"]
+    default_tz = config["default_tz"]
+    ok_enabled = config["ok_enabled"]
+    max_patients = config["max_patients"]
+
+    def _normalize_procedure_date(value: Any) -> date | None:
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        try:
+            s = str(value)
+            return date.fromisoformat(s[:10])
+        except Exception:
+            return None
+
     async def _get_patient_timezone(patient_id: int) -> str:
         try:
             tz_res = await db.execute(
@@ -876,143 +1132,263 @@ async def _internal_preview_adherence_nudges(
             pass
         return default_tz
 
-    max_patients = int(max_patients)
-    sample = int(sample)
-    if max_patients < 1:
-        max_patients = 1
-    if max_patients > 5000:
-        max_patients = 5000
-    if sample < 0:
-        sample = 0
-    if sample > max_patients:
-        sample = max_patients
+    remaining = max_patients
+    last_id = 0
+    while remaining > 0:
+        page_res = await db.execute(
+            select(models.Patient.id, models.Patient.procedure_date)
+            .join(models.DeviceToken, models.DeviceToken.patient_id == models.Patient.id)
+            .where(models.DeviceToken.active == True)
+            .where(or_(models.Patient.procedure_completed == False, models.Patient.procedure_completed.is_(None)))
+            .where(models.Patient.id > last_id)
+            .distinct()
+            .order_by(models.Patient.id.asc())
+            .limit(min(remaining, ADHERENCE_PREVIEW_PAGE_SIZE))
+        )
+        page = page_res.all()
+        if not page:
+            break
+        remaining -= len(page)
+        last_id = int(page[-1][0])
 
-    evaluated = 0
-    would_send_attention = 0
-    would_send_ok = 0
-    skipped = 0
-    reason_counts: dict[str, int] = {}
-    samples: list[dict[str, Any]] = []
+        for pid_raw, proc_raw in page:
+            pid = int(pid_raw)
+            proc_date = _normalize_procedure_date(proc_raw)
 
-    pat_res = await db.execute(
-        select(models.Patient)
-        .join(models.DeviceToken, models.DeviceToken.patient_id == models.Patient.id)
-        .where(models.DeviceToken.active == True)
-        .where(or_(models.Patient.procedure_completed == False, models.Patient.procedure_completed.is_(None)))
-        .distinct()
-        .limit(max_patients)
-    )
-    patients = pat_res.scalars().all()
+            reason: str | None = None
+            tz_name = await _get_patient_timezone(pid)
+            tz_fallback = False
+            try:
+                tz = pytz.timezone(tz_name)
+            except Exception:
+                tz = pytz.UTC
+                tz_name = "UTC"
+                tz_fallback = True
 
-    for p in patients:
-        evaluated += 1
-        pid = int(object.__getattribute__(p, "id"))
-        proc_date = _normalize_procedure_date(getattr(p, "procedure_date"))
+            now_local = now_utc.replace(tzinfo=pytz.UTC).astimezone(tz)
+            local_day = now_local.date()
+            total: int | None = None
+            followed: int | None = None
+            ratio_val: float | None = None
+            needs_attention: bool | None = None
 
-        reason: str | None = None
-        tz_name = await _get_patient_timezone(pid)
-        tz_fallback = False
-        try:
-            tz = pytz.timezone(tz_name)
-        except Exception:
-            tz = pytz.UTC
-            tz_name = "UTC"
-            tz_fallback = True
-
-        now_local = now_utc.replace(tzinfo=pytz.UTC).astimezone(tz)
-        local_day = now_local.date()
-
-        if not proc_date:
-            reason = "no_procedure_date"
-        elif now_local.hour not in allowed_hours:
-            reason = "outside_allowed_hour"
-        elif now_local.minute >= minute_window:
-            reason = "outside_minute_window"
-        else:
-            day_delta = (local_day - proc_date).days
-            if day_delta < 0 or (max_days_after >= 0 and day_delta > max_days_after):
-                reason = "procedure_day_out_of_range"
+            if not proc_date:
+                reason = "no_procedure_date"
+            elif now_local.hour not in allowed_hours:
+                reason = "outside_allowed_hour"
+            elif now_local.minute >= minute_window:
+                reason = "outside_minute_window"
             else:
-                # Adherence for today (local day)
-                sres = await db.execute(
-                    select(models.InstructionStatus.followed)
-                    .where(models.InstructionStatus.patient_id == pid)
-                    .where(models.InstructionStatus.date == local_day)
-                )
-                flags = [bool(row[0]) for row in sres.all()]
-                total = len(flags)
-                followed = sum(1 for f in flags if f)
-                ratio_val: float | None = None
-                if total > 0:
-                    ratio_val = followed / float(total)
-
-                needs_attention = (total == 0) or (ratio_val is not None and ratio_val < threshold)
-
-                # Would we send at all?
-                if (not needs_attention) and (not ok_enabled):
-                    reason = "ok_disabled"
+                day_delta = (local_day - proc_date).days
+                if day_delta < 0 or (max_days_after >= 0 and day_delta > max_days_after):
+                    reason = "procedure_day_out_of_range"
                 else:
-                    # Would it be suppressed as already sent today?
-                    prev = await db.execute(
-                        select(models.AdherenceNudge.id)
-                        .where(models.AdherenceNudge.patient_id == pid)
-                        .where(models.AdherenceNudge.local_date == local_day)
-                        .limit(1)
+                    # Adherence for today (local day)
+                    sres = await db.execute(
+                        select(models.InstructionStatus.followed)
+                        .where(models.InstructionStatus.patient_id == pid)
+                        .where(models.InstructionStatus.date == local_day)
                     )
-                    already = prev.scalar_one_or_none() is not None
-                    if already:
-                        reason = "already_nudged_today"
+                    flags = [bool(row[0]) for row in sres.all()]
+                    total = len(flags)
+                    followed = sum(1 for f in flags if f)
+                    if total > 0:
+                        ratio_val = followed / float(total)
+
+                    needs_attention = (total == 0) or (ratio_val is not None and ratio_val < threshold)
+
+                    # Would we send at all?
+                    if (not needs_attention) and (not ok_enabled):
+                        reason = "ok_disabled"
                     else:
-                        if needs_attention:
-                            would_send_attention += 1
-                        else:
-                            would_send_ok += 1
-
-                # Emit sample row when useful
-                if len(samples) < sample:
-                    samples.append(
-                        {
-                            "patient_id": pid,
-                            "timezone": tz_name,
-                            "tz_fallback": tz_fallback,
-                            "now_local": now_local.isoformat(),
-                            "local_day": local_day.isoformat(),
-                            "procedure_date": proc_date.isoformat() if proc_date else None,
-                            "adherence_total": total,
-                            "adherence_followed": followed,
-                            "adherence_ratio": ratio_val,
-                            "needs_attention": needs_attention,
-                            "would_send": None if reason else ("attention" if needs_attention else "ok"),
-                            "skip_reason": reason,
-                        }
-                    )
+                        # Would it be suppressed as already sent today?
+                        prev = await db.execute(
+                            select(models.AdherenceNudge.id)
+                            .where(models.AdherenceNudge.patient_id == pid)
+                            .where(models.AdherenceNudge.local_date == local_day)
+                            .limit(1)
+                        )
+                        if prev.scalar_one_or_none() is not None:
+                            reason = "already_nudged_today"
+
+            yield {
+                "patient_id": pid,
+                "timezone": tz_name,
+                "tz_fallback": tz_fallback,
+                "now_local": now_local.isoformat(),
+                "local_day": local_day.isoformat(),
+                "procedure_date": proc_date.isoformat() if proc_date else None,
+                "adherence_total": total,
+                "adherence_followed": followed,
+                "adherence_ratio": ratio_val,
+                "needs_attention": needs_attention,
+                "would_send": None if reason else ("attention" if needs_attention else "ok"),
+                "skip_reason": reason,
+            }
 
-        if reason:
-            skipped += 1
-            reason_counts[reason] = reason_counts.get(reason, 0) + 1
 
-    return {
+def _tally_adherence_preview(counts: dict[str, int], reason_counts: dict[str, int], rec: dict[str, Any]) -> None:
+    counts["evaluated"] += 1
+    reason = rec.get("skip_reason")
+    if reason:
+        counts["skipped"] += 1
+        reason_counts[reason] = reason_counts.get(reason, 0) + 1
+    elif rec.get("would_send") == "attention":
+        counts["would_send_attention"] += 1
+    elif rec.get("would_send") == "ok":
+        counts["would_send_ok"] += 1
+
+
+def _adherence_preview_envelope(config: dict[str, Any], now_utc: datetime) -> tuple[dict[str, Any], dict[str, int], dict[str, int]]:
+    """Return (envelope, counts, skip_reasons); counts/skip_reasons are live references."""
+    enabled = os.getenv("ADHERENCE_NUDGE_ENABLED", "1").lower() in {"1", "true", "yes", "on"}
+    counts = {"evaluated": 0, "would_send_attention": 0, "would_send_ok": 0, "skipped": 0}
+    reason_counts: dict[str, int] = {}
+    envelope = {
         "enabled": enabled,
         "now_utc": now_utc.isoformat() + "Z",
-        "config": {
-            "allowed_hours": sorted(list(allowed_hours)),
-            "minute_window": minute_window,
-            "threshold": threshold,
-            "max_days_after_procedure": max_days_after,
-            "default_tz": default_tz,
-            "ok_enabled": ok_enabled,
-            "max_patients": max_patients,
-            "sample": sample,
-        },
-        "counts": {
-            "evaluated": evaluated,
-            "would_send_attention": would_send_attention,
-            "would_send_ok": would_send_ok,
-            "skipped": skipped,
-        },
+        "config": config,
+        "counts": counts,
         "skip_reasons": reason_counts,
-        "samples": samples,
     }
+    return envelope, counts, reason_counts
+
+
+async def _internal_preview_adherence_nudges(
+    db: AsyncSession,
+    *,
+    max_patients: int = 200,
+    sample: int = 50,
+) -> dict[str, Any]:
+    """Dry-run preview for adherence nudges.
+
+    This does NOT send push notifications and does NOT write to AdherenceNudge.
+    Intended for ops/debug to verify config + eligibility quickly.
+    """
+    now_utc = datetime.utcnow()
+    config = _adherence_preview_config(max_patients, sample)
+    envelope, counts, reason_counts = _adherence_preview_envelope(config, now_utc)
+    samples: list[dict[str, Any]] = []
+    async for rec in _iter_adherence_preview(db, config, now_utc):
+        _tally_adherence_preview(counts, reason_counts, rec)
+        # Emit sample rows only for patients whose adherence was actually evaluated.
+        if rec["adherence_total"] is not None and len(samples) < config["sample"]:
+            samples.append(rec)
+    envelope["samples"] = samples
+    return envelope
+
+
+async def _stream_adherence_preview(*, max_patients: int) -> AsyncIterator[dict[str, Any]]:
+    """NDJSON variant of the preview: one line per patient, then a summary trailer."""
+    now_utc = datetime.utcnow()
+    config = _adherence_preview_config(max_patients, 0, max_cap=ADHERENCE_PREVIEW_STREAM_MAX_PATIENTS)
+    envelope, counts, reason_counts = _adherence_preview_envelope(config, now_utc)
+    # Streaming outlives the request-scoped session, so use a dedicated one.
+    async with AsyncSessionLocal() as db:
+        async for rec in _iter_adherence_preview(db, config, now_utc):
+            _tally_adherence_preview(counts, reason_counts, rec)
+            yield {"type": "patient", **rec}
+    yield {"type": "summary", **envelope}
+
+
+# --- Conditional GET (weak ETags) for the app's polling reads ---
+# Validators come from a cheap aggregate (row count + max(id) + max(updated_at))
+# or from the already-loaded row, so a 304 skips loading and serializing rows.
+def _weak_etag(*parts: Any) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match (RFC 9110 13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Return a 304 when the client's copy is current; otherwise tag the response."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+async def _table_etag(db: AsyncSession, scope: str, model, *where, changed_col=None) -> str:
+    col = changed_col if changed_col is not None else model.updated_at
+    row = (await db.execute(select(func.count(), func.max(model.id), func.max(col)).where(*where))).one()
+    return _weak_etag(scope, *row)
+
+
+# --- Opaque pagination cursors (urlsafe base64 of a small JSON object) ---
+def _encode_cursor(payload: dict[str, Any]) -> str:
+    raw = json.dumps(payload, separators=(",", ":"), default=_json_default).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> dict[str, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(data, dict):
+            raise ValueError("cursor payload must be an object")
+        return data
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _keyset_after(keys: list[tuple[Any, bool]], values: list[Any]):
+    """Row-value "after" predicate for an ORDER BY with mixed directions.
+
+    keys are (column, descending) in ORDER BY order; values are the last row's
+    values for those columns. (a DESC, b ASC) after (x, y) becomes
+    a < x OR (a = x AND b > y).
+    """
+    clauses = []
+    for i, (col, descending) in enumerate(keys):
+        prefix = [k == v for (k, _), v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*prefix, col < values[i] if descending else col > values[i]))
+    return or_(*clauses)
+
+
+# --- NDJSON streaming for bulk ops/diagnostic endpoints ---
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    return str(value)
+
+
+async def _ndjson_lines(records: AsyncIterator[dict[str, Any]]) -> AsyncIterator[bytes]:
+    try:
+        async for rec in records:
+            yield (json.dumps(rec, default=_json_default, separators=(",", ":")) + "\n").encode("utf-8")
+    except Exception as exc:
+        # Headers are already sent; report the failure in-band as the last line.
+        print(f"[ndjson] stream aborted: {exc}\n{traceback.format_exc()}")
+        yield (json.dumps({"type": "error", "error": str(exc)}) + "\n").encode("utf-8")
+
+
+def _ndjson_response(records: AsyncIterator[dict[str, Any]]) -> StreamingResponse:
+    """Stream dict records as newline-delimited JSON (application/x-ndjson).
+
+    Producers should yield row records and finish with a {"type": "summary", ...} trailer.
+    """
+    return StreamingResponse(
+        _ndjson_lines(records),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 def _require_task_token(request: Request) -> None:
@@ -1088,36 +1464,101 @@ async def task_run_adherence(request: Request, db: AsyncSession = Depends(get_db
         return {"ok": False, "error": str(exc)}
 
 
-@app.post("/tasks/adherence/test")
-@app.get("/tasks/adherence/test")
-async def task_test_adherence(
-    request: Request,
-    patient_id: int | None = None,
-    kind: str = "adherence_nudge",
-    title: str | None = None,
-    body: str | None = None,
-    db: AsyncSession = Depends(get_db),
-):
-    """Force-send an adherence/progress notification for testing.
-
-    Protected by TASK_TOKEN.
+@app.post("/tasks/episodes/rotate/run")
+@app.get("/tasks/episodes/rotate/run")
+async def task_run_episode_rotation(request: Request):
+    """Run the episode rotation sweeper immediately.
 
-    Query params:
-      - patient_id: optional; if omitted, sends to the first patient with an active token
-      - kind: 'adherence_nudge' or 'adherence_ok'
-      - title/body: optional overrides
+    Protected by TASK_TOKEN. Safe to call from several instances: only the
+    advisory-lock holder does work.
     """
     _require_task_token(request)
+    try:
+        return await _internal_sweep_episode_rotation()
+    except Exception as exc:
+        print(f"[tasks][rotation] fatal error: {exc}\n{traceback.format_exc()}")
+        return {"ok": False, "error": str(exc)}
 
-    kind_norm = (kind or "").strip()
-    if kind_norm not in {"adherence_nudge", "adherence_ok"}:
-        raise HTTPException(status_code=422, detail="kind must be adherence_nudge or adherence_ok")
 
-    if title is None:
-        if kind_norm == "adherence_ok":
-            title = os.getenv("ADHERENCE_ALRIGHT_TITLE") or os.getenv("ADHERENCE_OK_TITLE", "All right")
-        else:
-            title = os.getenv("ADHERENCE_NUDGE_TITLE", "Instruction Reminder")
+@app.post("/tasks/instruction-dictionary/compact")
+async def task_compact_instruction_dictionary(request: Request, batch_size: int = 5000, db: AsyncSession = Depends(get_db)):
+    """Move repeated instruction texts of existing instruction_status rows into instruction_dictionary.
+
+    Protected by TASK_TOKEN. Idempotent; safe to rerun after partial runs.
+    """
+    _require_task_token(request)
+    try:
+        return await instruction_dictionary.compact(db, batch_size=max(1, min(batch_size, 50000)))
+    except Exception as exc:
+        print(f"[tasks][instruction-dictionary] fatal error: {exc}\n{traceback.format_exc()}")
+        return {"ok": False, "error": str(exc)}
+
+
+@app.post("/tasks/doctor-ids/backfill")
+async def task_backfill_doctor_ids(request: Request, db: AsyncSession = Depends(get_db)):
+    """Resolve free-text doctor names on patients/episodes into doctor_id (also run at startup).
+
+    Protected by TASK_TOKEN. Idempotent; reports names that match no (or several) doctors.
+    """
+    _require_task_token(request)
+    try:
+        doctor_directory.invalidate()
+        res = await doctor_directory.backfill(db)
+        await response_cache.dashboard_cache.invalidate_all()
+        return {"ok": True, **res}
+    except Exception as exc:
+        print(f"[tasks][doctor-ids] fatal error: {exc}\n{traceback.format_exc()}")
+        return {"ok": False, "error": str(exc)}
+
+
+@app.post("/tasks/latest-episodes/rebuild")
+async def task_rebuild_latest_episodes(request: Request, db: AsyncSession = Depends(get_db)):
+    """Recompute patient_latest_episodes and completed_patient_episodes from
+    treatment_episodes (repair after manual SQL edits).
+
+    Protected by TASK_TOKEN.
+    """
+    _require_task_token(request)
+    try:
+        rows = await latest_episodes.rebuild(db)
+        completed_rows = await completed_episodes.rebuild(db)
+        await response_cache.dashboard_cache.invalidate_all()
+        return {"ok": True, "rows": rows, "completed_rows": completed_rows}
+    except Exception as exc:
+        print(f"[tasks][latest-episodes] fatal error: {exc}\n{traceback.format_exc()}")
+        return {"ok": False, "error": str(exc)}
+
+
+@app.post("/tasks/adherence/test")
+@app.get("/tasks/adherence/test")
+async def task_test_adherence(
+    request: Request,
+    patient_id: int | None = None,
+    kind: str = "adherence_nudge",
+    title: str | None = None,
+    body: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Force-send an adherence/progress notification for testing.
+
+    Protected by TASK_TOKEN.
+
+    Query params:
+      - patient_id: optional; if omitted, sends to the first patient with an active token
+      - kind: 'adherence_nudge' or 'adherence_ok'
+      - title/body: optional overrides
+    """
+    _require_task_token(request)
+
+    kind_norm = (kind or "").strip()
+    if kind_norm not in {"adherence_nudge", "adherence_ok"}:
+        raise HTTPException(status_code=422, detail="kind must be adherence_nudge or adherence_ok")
+
+    if title is None:
+        if kind_norm == "adherence_ok":
+            title = os.getenv("ADHERENCE_ALRIGHT_TITLE") or os.getenv("ADHERENCE_OK_TITLE", "All right")
+        else:
+            title = os.getenv("ADHERENCE_NUDGE_TITLE", "Instruction Reminder")
     if body is None:
         if kind_norm == "adherence_ok":
             body = os.getenv("ADHERENCE_ALRIGHT_BODY") or os.getenv(
@@ -1190,14 +1631,20 @@ async def task_preview_adherence(
     request: Request,
     max_patients: int = 200,
     sample: int = 50,
+    stream: bool = False,
     db: AsyncSession = Depends(get_db),
 ):
     """Dry-run preview of adherence nudges.
 
     Protected by TASK_TOKEN.
     Does not send notifications and does not write AdherenceNudge.
+    Query params:
+      - stream=1: NDJSON, one line per evaluated patient plus a summary trailer line.
+        max_patients may go up to ADHERENCE_PREVIEW_STREAM_MAX_PATIENTS; sample is ignored.
     """
     _require_task_token(request)
+    if stream:
+        return _ndjson_response(_stream_adherence_preview(max_patients=max_patients))
     return await _internal_preview_adherence_nudges(db, max_patients=max_patients, sample=sample)
 
 async def get_bearer_token(request: Request) -> str:
@@ -1323,7 +1770,9 @@ async def _get_or_create_open_episode(db: AsyncSession, patient_id: int) -> mode
             object.__setattr__(ep, 'locked', True)
             db.add(ep)
         if len(open_episodes) > 1:
+            await _refresh_episode_summaries(db, [patient_id])
             await db.commit()
+            await response_cache.dashboard_cache.invalidate(*[response_cache.doctor_scope(e.doctor_id, e.doctor) for e in open_episodes[1:]])
         newest = open_episodes[0]
 
         # Safety: never allow a completed episode to remain editable.
@@ -1333,13 +1782,16 @@ async def _get_or_create_open_episode(db: AsyncSession, patient_id: int) -> mode
         if bool(getattr(newest, 'procedure_completed', False)) and not bool(getattr(newest, 'locked', False)):
             object.__setattr__(newest, 'locked', True)
             db.add(newest)
+            await _refresh_episode_summaries(db, [patient_id])
             await db.commit()
+            await response_cache.dashboard_cache.invalidate(response_cache.doctor_scope(newest.doctor_id, newest.doctor))
 
             new_ep = models.TreatmentEpisode(
                 patient_id=patient_id,
                 # Preserve assignment to keep doctor dashboards stable.
                 department=getattr(newest, 'department', None),
                 doctor=getattr(newest, 'doctor', None),
+                doctor_id=getattr(newest, 'doctor_id', None),
                 treatment=None,
                 subtype=None,
                 procedure_completed=False,
@@ -1370,17 +1822,49 @@ async def _get_or_create_open_episode(db: AsyncSession, patient_id: int) -> mode
     await db.refresh(new_ep)
     return new_ep
 
+# Completed episodes roll over to a fresh open episode this many days after the procedure.
+EPISODE_ROTATION_DAYS = 15
+
+
+def _rotation_due_on(episode: models.TreatmentEpisode) -> date:
+    """Earliest date _rotate_if_due needs to look at this (open) episode again."""
+    if getattr(episode, 'locked', False) or not getattr(episode, 'procedure_completed', False):
+        return date.max
+    # Completed but still open: _get_or_create_open_episode locks and replaces it on the
+    # next full check, so it is due immediately.
+    return date.min
+
+
+async def _refresh_episode_summaries(db: AsyncSession, patient_ids: list[int]) -> None:
+    """Update the episode summary tables for patient_ids in the caller's transaction."""
+    await latest_episodes.refresh(db, patient_ids)
+    await completed_episodes.refresh(db, patient_ids)
+
+
 async def _mirror_episode_to_patient(db: AsyncSession, patient: models.Patient, episode: models.TreatmentEpisode) -> None:
+    old_scope = response_cache.doctor_scope(patient.doctor_id, patient.doctor)
     patient.department = episode.department
     patient.doctor = episode.doctor
+    patient.doctor_id = episode.doctor_id
     patient.treatment = episode.treatment
     patient.treatment_subtype = episode.subtype
     patient.procedure_date = episode.procedure_date
     patient.procedure_time = episode.procedure_time
     patient.procedure_completed = episode.procedure_completed
+    patient.rotation_due_on = _rotation_due_on(episode)
     db.add(patient)
+    await _refresh_episode_summaries(db, [patient.id])
     await db.commit()
     await db.refresh(patient)
+    await response_cache.dashboard_cache.invalidate(old_scope, response_cache.doctor_scope(episode.doctor_id, episode.doctor))
+
+
+async def _invalidate_patient_dashboards(patient: models.Patient) -> None:
+    """Drop cached dashboard lists of the patient's doctor; call after any committed
+    write to a patient field those lists show (name, contact, completion markers)."""
+    await response_cache.dashboard_cache.invalidate(
+        response_cache.doctor_scope(getattr(patient, 'doctor_id', None), getattr(patient, 'doctor', None))
+    )
 
 
 async def _cleanup_unverified_patient_later(patient_id: int, retention_hours: int = UNVERIFIED_SIGNUP_RETENTION_HOURS) -> None:
@@ -1394,6 +1878,7 @@ async def _cleanup_unverified_patient_later(patient_id: int, retention_hours: in
             if patient and not getattr(patient, "is_verified", False):
                 await _session.delete(patient)
                 await _session.commit()
+                await _invalidate_patient_dashboards(patient)
                 print(f"[signup-cleanup] Deleted unverified patient id={patient_id} after {retention_hours}h")
     except Exception as exc:
         print(f"[signup-cleanup] Cleanup failed for patient id={patient_id}: {exc}")
@@ -1404,12 +1889,24 @@ def _schedule_unverified_cleanup(patient_id: int) -> None:
     asyncio.create_task(_cleanup_unverified_patient_later(patient_id))
 
 async def _rotate_if_due(db: AsyncSession, patient: models.Patient) -> Optional[int]:
-    ep = await _get_or_create_open_episode(db, object.__getattribute__(patient, 'id'))
-    if getattr(ep, "locked", False):
-        return None
-    if not getattr(ep, "procedure_completed", False) or not getattr(ep, "procedure_date", None):
+    # Fast path: the cached marker on the already-loaded patient row says nothing is due,
+    # so skip loading (and possibly repairing) open episodes entirely.
+    due_on = getattr(patient, 'rotation_due_on', None)
+    if due_on is not None and date.today() < due_on:
         return None
-    if (date.today() - ep.procedure_date).days < 15:
+
+    ep = await _get_or_create_open_episode(db, object.__getattribute__(patient, 'id'))
+    if getattr(ep, "locked", False) or not getattr(ep, "procedure_completed", False) or not getattr(ep, "procedure_date", None) \
+            or (date.today() - ep.procedure_date).days < EPISODE_ROTATION_DAYS:
+        marker = _rotation_due_on(ep)
+        if due_on != marker:
+            try:
+                object.__setattr__(patient, 'rotation_due_on', marker)
+                db.add(patient)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                print(f"[rotate] rotation_due_on update skipped for patient {getattr(patient, 'id', None)}: {e}")
         return None
 
     object.__setattr__(ep, 'locked', True)
@@ -1434,6 +1931,111 @@ async def _rotate_if_due(db: AsyncSession, patient: models.Patient) -> Optional[
     await _mirror_episode_to_patient(db, patient, new_ep)
     return object.__getattribute__(new_ep, 'id')
 
+# Only one worker should sweep at a time; Postgres advisory lock key for that.
+EPISODE_ROTATION_SWEEP_LOCK_KEY = 7301533
+_episode_rotation_sweep_lock = asyncio.Lock()
+
+
+async def _internal_sweep_episode_rotation(*, batch_size: int = 500, max_batches: int = 50) -> dict[str, Any]:
+    """Rotate every due episode in bulk (same rule as _rotate_if_due).
+
+    Per batch, in one transaction:
+      1. lock open, completed episodes whose procedure_date is EPISODE_ROTATION_DAYS old,
+      2. insert a fresh open episode for each affected patient without one,
+      3. mirror the (empty) new episode onto those patients and mark rotation not due.
+    On Postgres the batch only runs when pg_try_advisory_xact_lock succeeds, so with
+    several workers a single leader sweeps; the others report skipped.
+    """
+    if _episode_rotation_sweep_lock.locked():
+        return {"ok": True, "skipped": "already_running", "rotated": 0}
+    te = models.TreatmentEpisode
+    cutoff = date.today() - timedelta(days=EPISODE_ROTATION_DAYS)
+    rotated = 0
+    created = 0
+    batches = 0
+    async with _episode_rotation_sweep_lock:
+        for _ in range(max(1, max_batches)):
+            async with AsyncSessionLocal() as db:
+                if db.get_bind().dialect.name == "postgresql":
+                    got = (await db.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": EPISODE_ROTATION_SWEEP_LOCK_KEY})).scalar()
+                    if not got:
+                        return {"ok": True, "skipped": "not_leader", "rotated": rotated}
+
+                due_ids = (
+                    select(te.id)
+                    .where(te.locked == False, te.procedure_completed == True, te.procedure_date <= cutoff)
+                    .order_by(te.id)
+                    .limit(batch_size)
+                    .scalar_subquery()
+                )
+                res = await db.execute(
+                    update(te)
+                    .where(te.id.in_(due_ids))
+                    .values(locked=True)
+                    .returning(te.id, te.patient_id)
+                    .execution_options(synchronize_session=False)
+                )
+                locked_rows = res.all()
+                if not locked_rows:
+                    await db.commit()
+                    break
+                batches += 1
+                rotated += len(locked_rows)
+                patient_ids = sorted({int(r.patient_id) for r in locked_rows})
+                res = await db.execute(
+                    select(models.Patient.doctor_id, models.Patient.doctor).where(models.Patient.id.in_(patient_ids)).distinct()
+                )
+                stale_scopes = {response_cache.doctor_scope(r.doctor_id, r.doctor) for r in res.all()}
+
+                # Patients that somehow still have another open episode keep it.
+                res = await db.execute(
+                    select(te.patient_id).where(te.patient_id.in_(patient_ids), te.locked == False).distinct()
+                )
+                has_open = {int(r[0]) for r in res.all()}
+                needs_new = [pid for pid in patient_ids if pid not in has_open]
+                if needs_new:
+                    now = datetime.utcnow()
+                    await db.execute(insert(te).values([
+                        {
+                            "patient_id": pid,
+                            "department": None,
+                            "doctor": None,
+                            "treatment": None,
+                            "subtype": None,
+                            "procedure_completed": False,
+                            "locked": False,
+                            "procedure_date": None,
+                            "procedure_time": None,
+                            "created_at": now,
+                        }
+                        for pid in needs_new
+                    ]))
+                    created += len(needs_new)
+                    # Same values _mirror_episode_to_patient writes for a fresh open episode.
+                    await db.execute(
+                        update(models.Patient)
+                        .where(models.Patient.id.in_(needs_new))
+                        .values(
+                            department=None,
+                            doctor=None,
+                            doctor_id=None,
+                            treatment=None,
+                            treatment_subtype=None,
+                            procedure_date=None,
+                            procedure_time=None,
+                            procedure_completed=False,
+                            rotation_due_on=date.max,
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                await _refresh_episode_summaries(db, patient_ids)
+                await db.commit()
+                await response_cache.dashboard_cache.invalidate(*stale_scopes)
+            if len(locked_rows) < batch_size:
+                break
+    return {"ok": True, "rotated": rotated, "episodes_created": created, "batches": batches, "cutoff": cutoff.isoformat()}
+
+
 @app.post("/signup", response_model=schemas.TokenResponse)
 async def signup(patient: schemas.PatientCreate, db: AsyncSession = Depends(get_db)):
     errors = {}
@@ -1719,12 +2321,24 @@ async def doctor_register(request: Request, doctor: schemas.DoctorCreate = Body(
     db.add(db_doc)
     await db.commit()
     await db.refresh(db_doc)
+    # Patients may already have picked this doctor by name.
+    try:
+        doctor_directory.invalidate()
+        await doctor_directory.backfill(db)
+    except Exception as e:
+        print(f"[doctor/register] doctor_id backfill skipped: {e}")
+    await response_cache.dashboard_cache.invalidate_all()
     access_token = create_access_token(data={"sub": db_doc.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/patients/me", response_model=schemas.PatientPublic)
-async def get_my_profile(current_user: models.Patient = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_my_profile(request: Request, response: Response, current_user: models.Patient = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     await _rotate_if_due(db, current_user)
+    # Patients have no updated_at; the row is already loaded, so hash the public fields.
+    etag = _weak_etag("patients/me", *(getattr(current_user, f, None) for f in schemas.PatientPublic.model_fields))
+    not_modified = _conditional(request, response, etag)
+    if not_modified is not None:
+        return not_modified
     return current_user
 
 
@@ -1744,8 +2358,57 @@ async def update_my_theme_mode(
     current_user.theme_mode = mode
     await db.commit()
     await db.refresh(current_user)
+    await _invalidate_patient_dashboards(current_user)
     return current_user
 
+async def _doctor_match(db: AsyncSession, doctor: str, id_col, name_col):
+    """Filter for rows assigned to `doctor`: the indexed doctor_id when the name
+    resolves to a doctor row (any "Dr." / case variant), else the legacy exact text match.
+
+    Rows carrying the exact text but no doctor_id still match: a worker whose directory
+    cache predates the doctor writes them until the next backfill."""
+    doc_id = await doctor_directory.resolve(db, doctor)
+    if doc_id is not None:
+        return or_(id_col == doc_id, and_(id_col.is_(None), name_col == doctor))
+    return name_col == doctor
+
+
+_PATIENT_PUBLIC_LIST = TypeAdapter(List[schemas.PatientPublic])
+_PATIENT_EPISODE_LIST = TypeAdapter(List[schemas.PatientEpisodePublic])
+_PATIENT_EPISODE_FIELDS = tuple(schemas.PatientEpisodePublic.model_fields)
+
+
+async def _dashboard_cache_lookup(db: AsyncSession, request: Request, doctor: str) -> tuple[Optional[str], str, Optional[Response]]:
+    """(scope, key, cached response or None) for a doctor dashboard list request."""
+    scope = response_cache.doctor_scope(await doctor_directory.resolve(db, doctor), doctor)
+    key = request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    entry = await response_cache.dashboard_cache.get(scope, key)
+    if entry is None:
+        return scope, key, None
+    # Entry = one JSON line of response headers, then the body.
+    head, _, body = entry.partition(b"\n")
+    headers = {**json.loads(head), "X-Cache": "HIT"}
+    return scope, key, Response(content=body, media_type="application/json", headers=headers)
+
+
+async def _dashboard_cache_store(
+    scope: Optional[str], key: str, adapter: TypeAdapter, value: Any, headers: Optional[dict[str, str]] = None,
+) -> Response:
+    """Serialize value as response_model would, cache it with headers, and return it.
+
+    value is a list of plain dicts built server-side in the schema's shape, so by
+    default it is encoded directly (fast_json); FAST_JSON_RESPONSES=0 validates
+    it through adapter first.
+    """
+    headers = headers or {}
+    if fast_json.enabled():
+        body = fast_json.dumps(value)
+    else:
+        body = adapter.dump_json(adapter.validate_python(value))
+    await response_cache.dashboard_cache.put(scope, key, json.dumps(headers).encode("utf-8") + b"\n" + body)
+    return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "MISS"})
+
+
 # -------------------------------------------------
 # Temporary public endpoint: list patients by doctor
 # SECURITY NOTE: This endpoint is unauthenticated right now to support
@@ -1754,47 +2417,32 @@ async def update_my_theme_mode(
 # -------------------------------------------------
 @app.get("/patients/by-doctor", response_model=List[schemas.PatientPublic])
 async def list_patients_by_doctor(
+    request: Request,
     doctor: str,
     db: AsyncSession = Depends(get_db),
     current_doctor: models.Doctor = Depends(get_current_doctor),
 ):
+    cache_scope, cache_key, cached = await _dashboard_cache_lookup(db, request, doctor)
+    if cached is not None:
+        return cached
     start = datetime.utcnow()
     print(f"[patients/by-doctor] inbound doctor='{doctor}' @ {start.isoformat()}Z")
     try:
-        stmt = select(models.Patient).where(models.Patient.doctor == doctor)
+        stmt = select(models.Patient).where(await _doctor_match(db, doctor, models.Patient.doctor_id, models.Patient.doctor))
         # Enforce DB execution timeout (5s) to surface stalls
         async def _run():
             res = await db.execute(stmt)
             return res.scalars().all()
         patients = await asyncio.wait_for(_run(), timeout=5.0)
 
-        # Pull the latest episode per patient with a non-empty treatment.
-        # This keeps the dashboard stable even after an episode completes and a new blank episode is opened.
+        # Latest episode per patient with a non-empty treatment, from the maintained summary
+        # (latest_episodes). This keeps the dashboard stable even after an episode completes
+        # and a new blank episode is opened.
         pt_ids = [object.__getattribute__(p, "id") for p in patients]
         latest_by_patient: dict[int, Any] = {}
         if pt_ids:
-            ep = models.TreatmentEpisode
-            ranked = (
-                select(
-                    ep.patient_id.label("patient_id"),
-                    ep.department.label("department"),
-                    ep.doctor.label("doctor"),
-                    ep.treatment.label("treatment"),
-                    ep.subtype.label("subtype"),
-                    ep.procedure_date.label("procedure_date"),
-                    ep.procedure_time.label("procedure_time"),
-                    ep.procedure_completed.label("procedure_completed"),
-                    ep.locked.label("locked"),
-                    ep.id.label("episode_id"),
-                    func.row_number().over(partition_by=ep.patient_id, order_by=ep.id.desc()).label("rn"),
-                )
-                .where(ep.patient_id.in_(pt_ids))
-                .where(ep.treatment.is_not(None))
-                .where(ep.treatment != "")
-                .subquery()
-            )
-            latest_stmt = select(ranked).where(ranked.c.rn == 1)
-            latest_rows = (await db.execute(latest_stmt)).mappings().all()
+            le = models.PatientLatestEpisode.__table__
+            latest_rows = (await db.execute(select(le).where(le.c.patient_id.in_(pt_ids)))).mappings().all()
             latest_by_patient = {int(r["patient_id"]): r for r in latest_rows}
 
         # Build response objects using patient identity fields + episode-derived treatment fields when available.
@@ -1826,7 +2474,7 @@ async def list_patients_by_doctor(
             )
         elapsed = (datetime.utcnow() - start).total_seconds()*1000
         print(f"[patients/by-doctor] doctor='{doctor}' count={len(out)} elapsed_ms={elapsed:.1f}")
-        return out
+        return await _dashboard_cache_store(cache_scope, cache_key, _PATIENT_PUBLIC_LIST, out)
     except asyncio.TimeoutError:
         elapsed = (datetime.utcnow() - start).total_seconds()*1000
         print(f"[patients/by-doctor][timeout] doctor='{doctor}' after {elapsed:.1f}ms")
@@ -1836,9 +2484,59 @@ async def list_patients_by_doctor(
         raise
 
 
+# Keyset sorts for /patients/by-doctor-episodes: (expression, descending, cursor decoder).
+# Every sort ends in episode id so keys are unique; NULL procedure dates sort last via COALESCE.
+_EPISODE_DATE_NULLS_LAST = date(1, 1, 1)
+DOCTOR_EPISODES_PAGE_MAX = 500
+
+
+def _doctor_episode_sort_keys(sort: str) -> list[tuple[Any, bool, Any]]:
+    ep = models.TreatmentEpisode
+    pt = models.Patient
+    # Inlined (not bound) so the planner matches ix_treatment_episodes_doctor_id_procedure_date.
+    proc_date = func.coalesce(ep.procedure_date, literal(_EPISODE_DATE_NULLS_LAST, literal_execute=True))
+    if sort == "name":
+        return [(pt.name, False, str), (proc_date, True, date.fromisoformat), (ep.created_at, True, datetime.fromisoformat), (ep.id, True, int)]
+    if sort == "recent":
+        return [(ep.id, True, int)]
+    if sort == "procedure_date":
+        return [(proc_date, True, date.fromisoformat), (ep.id, True, int)]
+    raise HTTPException(status_code=400, detail="sort must be one of: name, recent, procedure_date")
+
+
+@app.get("/patients/by-doctor-episodes/count")
+async def count_patient_episodes_by_doctor(
+    request: Request,
+    doctor: str,
+    db: AsyncSession = Depends(get_db),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+):
+    """Number of rows /patients/by-doctor-episodes would return in total (exact; doctor_id index)."""
+    cache_scope, cache_key, cached = await _dashboard_cache_lookup(db, request, doctor)
+    if cached is not None:
+        return cached
+    ep = models.TreatmentEpisode
+    stmt = (
+        select(func.count())
+        .select_from(ep)
+        .where(await _doctor_match(db, doctor, ep.doctor_id, ep.doctor))
+        .where(ep.treatment.is_not(None))
+        .where(ep.treatment != "")
+    )
+    try:
+        n = await asyncio.wait_for(db.scalar(stmt), timeout=5.0)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="DB timeout counting patient episodes")
+    return await _dashboard_cache_store(cache_scope, cache_key, TypeAdapter(dict[str, Any]), {"doctor": doctor, "count": int(n or 0)})
+
+
 @app.get("/patients/by-doctor-episodes", response_model=List[schemas.PatientEpisodePublic])
 async def list_patient_episodes_by_doctor(
+    request: Request,
     doctor: str,
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_doctor: models.Doctor = Depends(get_current_doctor),
 ):
@@ -1846,64 +2544,164 @@ async def list_patient_episodes_by_doctor(
 
     Returns one row per treatment episode that belongs to the doctor.
     Filters out episodes that don't have a treatment set yet.
+    Served from response_cache when the doctor's data hasn't changed (X-Cache: HIT).
+
+    Paging: ?limit=N (max 500) returns one keyset page; pass X-Next-Cursor back as
+    ?cursor= (absent on the last page). Without limit/cursor the whole list is
+    returned. Total: /patients/by-doctor-episodes/count.
+
+    sort = recent (newest episode first), procedure_date (newest procedure first)
+    or name (patient name, newest procedure first). recent and procedure_date pages
+    walk a (doctor_id, ...) index; name has to sort the doctor's whole episode set
+    on every page, so it is the default only for the unpaged list and paged calls
+    default to recent.
     """
+    if not sort:
+        sort = "recent" if (limit is not None or cursor) else "name"
+    keys = _doctor_episode_sort_keys(sort)
+    cache_scope, cache_key, cached = await _dashboard_cache_lookup(db, request, doctor)
+    if cached is not None:
+        return cached
     start = datetime.utcnow()
-    print(f"[patients/by-doctor-episodes] inbound doctor='{doctor}' @ {start.isoformat()}Z")
+    print(f"[patients/by-doctor-episodes] inbound doctor='{doctor}' sort={sort} limit={limit} @ {start.isoformat()}Z")
     try:
         ep = models.TreatmentEpisode
         pt = models.Patient
+        # Plain columns rather than ORM entities: rows go straight into response dicts.
         stmt = (
-            select(ep, pt)
+            select(
+                pt.id.label("patient_id"),
+                ep.id.label("episode_id"),
+                pt.username,
+                pt.name,
+                func.coalesce(func.nullif(ep.department, ""), pt.department).label("department"),
+                func.coalesce(func.nullif(ep.doctor, ""), pt.doctor).label("doctor"),
+                ep.treatment,
+                ep.subtype.label("treatment_subtype"),
+                ep.procedure_date,
+                ep.procedure_time,
+                ep.procedure_completed,
+                ep.locked,
+                ep.created_at,
+            )
             .join(pt, ep.patient_id == pt.id)
-            .where(ep.doctor == doctor)
+            .where(await _doctor_match(db, doctor, ep.doctor_id, ep.doctor))
             .where(ep.treatment.is_not(None))
             .where(ep.treatment != "")
-            .order_by(pt.name.asc(), ep.procedure_date.desc().nullslast(), ep.created_at.desc())
+            .order_by(*[col.desc() if descending else col.asc() for col, descending, _ in keys])
         )
+        if cursor:
+            data = _decode_cursor(cursor)
+            raw = data.get("k")
+            if data.get("s") != sort or not isinstance(raw, list) or len(raw) != len(keys):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            try:
+                after = [decode(v) for (_, _, decode), v in zip(keys, raw)]
+            except Exception:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            stmt = stmt.where(_keyset_after([(col, descending) for col, descending, _ in keys], after))
+        page_size = None
+        if limit is not None or cursor:
+            page_size = max(1, min(limit or DOCTOR_EPISODES_PAGE_MAX, DOCTOR_EPISODES_PAGE_MAX))
+            stmt = stmt.limit(page_size + 1)
 
         async def _run():
             res = await db.execute(stmt)
             return res.all()
 
         rows = await asyncio.wait_for(_run(), timeout=5.0)
-        out: List[schemas.PatientEpisodePublic] = []
-        for ep_row, pt_row in rows:
-            out.append(
-                schemas.PatientEpisodePublic(
-                    patient_id=object.__getattribute__(pt_row, "id"),
-                    episode_id=object.__getattribute__(ep_row, "id"),
-                    username=object.__getattribute__(pt_row, "username"),
-                    name=object.__getattribute__(pt_row, "name"),
-                    department=getattr(ep_row, "department", None) or getattr(pt_row, "department", None),
-                    doctor=getattr(ep_row, "doctor", None) or getattr(pt_row, "doctor", None),
-                    treatment=getattr(ep_row, "treatment", None),
-                    treatment_subtype=getattr(ep_row, "subtype", None),
-                    procedure_date=getattr(ep_row, "procedure_date", None),
-                    procedure_time=getattr(ep_row, "procedure_time", None),
-                    procedure_completed=getattr(ep_row, "procedure_completed", None),
-                    locked=getattr(ep_row, "locked", None),
-                )
-            )
+        headers: dict[str, str] = {}
+        if page_size is not None:
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            if has_more:
+                last = rows[-1]
+                values = {
+                    "name": [last.name, last.procedure_date or _EPISODE_DATE_NULLS_LAST, last.created_at, last.episode_id],
+                    "recent": [last.episode_id],
+                    "procedure_date": [last.procedure_date or _EPISODE_DATE_NULLS_LAST, last.episode_id],
+                }[sort]
+                headers["X-Next-Cursor"] = _encode_cursor({"s": sort, "k": values})
+            headers["X-Has-More"] = "true" if has_more else "false"
+        out = [{f: row[f] for f in _PATIENT_EPISODE_FIELDS} for row in (r._mapping for r in rows)]
 
         elapsed = (datetime.utcnow() - start).total_seconds() * 1000
         print(f"[patients/by-doctor-episodes] doctor='{doctor}' count={len(out)} elapsed_ms={elapsed:.1f}")
-        return out
+        return await _dashboard_cache_store(cache_scope, cache_key, _PATIENT_EPISODE_LIST, out, headers)
     except asyncio.TimeoutError:
         elapsed = (datetime.utcnow() - start).total_seconds() * 1000
         print(f"[patients/by-doctor-episodes][timeout] doctor='{doctor}' after {elapsed:.1f}ms")
         raise HTTPException(status_code=504, detail="DB timeout fetching patient episodes")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[patients/by-doctor-episodes][error] doctor='{doctor}' error={e}")
         raise
 
+PATIENT_SEARCH_MAX_RESULTS = 1000
+
+
+@app.get("/patients/search", response_model=schemas.PatientSearchResponse)
+async def search_patients(
+    q: str,
+    doctor: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+):
+    """Ranked patient search over name, username, email and phone (see patient_search).
+
+    ?doctor= narrows to that doctor's patients (same matching as /patients/by-doctor).
+    Pass next_cursor back as ?cursor= for the next page.
+    """
+    q = (q or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required")
+    limit = max(1, min(limit, 50))
+    offset = 0
+    if cursor:
+        data = _decode_cursor(cursor)
+        if data.get("q") != q or not isinstance(data.get("o"), int) or data["o"] < 0:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        offset = data["o"]
+    where = []
+    if doctor:
+        where.append(await _doctor_match(db, doctor, models.Patient.doctor_id, models.Patient.doctor))
+    try:
+        hits = await asyncio.wait_for(patient_search.search(db, q, *where, limit=limit + 1, offset=offset), timeout=5.0)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="DB timeout searching patients")
+    next_cursor = None
+    if len(hits) > limit and offset + limit < PATIENT_SEARCH_MAX_RESULTS:
+        next_cursor = _encode_cursor({"q": q, "o": offset + limit})
+    results = [
+        {
+            "patient_id": p.id,
+            "username": p.username,
+            "name": p.name,
+            "phone": p.phone,
+            "email": p.email,
+            "doctor": p.doctor,
+            "treatment": p.treatment,
+            "treatment_subtype": p.treatment_subtype,
+            "score": round(score, 4),
+        }
+        for p, score in hits[:limit]
+    ]
+    return {"query": q, "mode": patient_search.mode(), "results": results, "next_cursor": next_cursor}
+
+
 @app.get("/patients/by-doctor-debug")
 async def list_patients_by_doctor_debug(doctor: str, db: AsyncSession = Depends(get_db)):
     """Debug variant: returns minimal patient identifiers and uses case-insensitive & prefix-less matching.
 
     Matching logic:
-      - Exact doctor
-      - Case-insensitive
-      - Strips a leading 'Dr. ' from either side for comparison
+      - Name resolves to a doctor row (doctor_directory): indexed doctor_id match
+      - Otherwise fuzzy text scan:
+        - Exact doctor
+        - Case-insensitive
+        - Strips a leading 'Dr. ' from either side for comparison
     """
     start = datetime.utcnow()
     print(f"[patients/by-doctor-debug] inbound doctor='{doctor}'")
@@ -1922,6 +2720,9 @@ async def list_patients_by_doctor_debug(doctor: str, db: AsyncSession = Depends(
     cond = cond | (func.lower(models.Patient.doctor) == target)
     cond = cond | func.lower(models.Patient.doctor).ilike(f"%{target}%")
     try:
+        doc_id = await doctor_directory.resolve(db, doctor)
+        if doc_id is not None:
+            cond = models.Patient.doctor_id == doc_id
         res = await db.execute(select(models.Patient.username, models.Patient.doctor).where(cond))
         rows = res.all()
         elapsed = (datetime.utcnow() - start).total_seconds()*1000
@@ -1935,28 +2736,120 @@ async def list_patients_by_doctor_debug(doctor: str, db: AsyncSession = Depends(
 # Instruction progress (last N days) for a patient (TEMP: no auth)
 # SECURITY: Should be protected by doctor auth & assignment validation.
 # ------------------------------------------------------------------
+def _canonical_instruction_index(grp: str, text: Optional[str], stored_index: int) -> int:
+    """Identity index the enhanced materializer uses: from the canonical text, else the stored index."""
+    canon = instruction_catalog.canonical_instruction_text(text)
+    if grp and canon:
+        try:
+            return int(instruction_catalog.stable_instruction_index(grp, canon))
+        except Exception:
+            pass
+    return int(stored_index)
+
+
+async def _instruction_progress_aggregate(db: AsyncSession, patient: models.Patient, days: int) -> Optional[list[dict]]:
+    """Per-day followed/unfollowed/total straight from grouped SQL counts.
+
+    Equivalent to summing doctor_instruction_status_enhanced (with placeholders) when the
+    patient's treatment has a catalog: every catalog identity counts once per day, followed
+    only if its row says so. Like the materializer, a row's identity is re-derived from its
+    canonical text (the stored index is only a fallback), so rows written by older clients
+    or before a catalog reorder land on the same identity. Returns None when that
+    equivalence can't be guaranteed (no catalog, identities outside the catalog, or several
+    rows for one identity on a day) so the caller falls back to the materializer.
+    """
+    catalog = instruction_catalog.expected_instruction_identities(
+        treatment=patient.treatment,
+        subtype=patient.treatment_subtype,
+    )
+    if not catalog:
+        return None
+    date_to = date.today()
+    date_from = date_to - timedelta(days=days - 1)
+    ist = models.InstructionStatus
+    dic = models.InstructionDictionary
+    grp = func.lower(func.trim(ist.group))
+    # Effective text, as InstructionStatus.instruction_text reads it (join instead of a subquery so it can be grouped).
+    txt = func.coalesce(ist.instruction_text_stored, dic.instruction_text)
+    res = await db.execute(
+        select(
+            ist.date,
+            grp.label("grp"),
+            ist.instruction_index,
+            txt.label("txt"),
+            func.count().label("n"),
+            func.max(case((ist.followed == True, 1), else_=0)).label("followed"),
+        )
+        .select_from(ist)
+        .outerjoin(dic, and_(dic.group == ist.group, dic.instruction_index == ist.instruction_index))
+        .where(ist.patient_id == patient.id, ist.date >= date_from, ist.date <= date_to)
+        .group_by(ist.date, grp, ist.instruction_index, txt)
+    )
+    seen: set[tuple] = set()
+    followed_by_day: dict[date, int] = {}
+    for row in res.all():
+        idx = _canonical_instruction_index(row.grp, row.txt, row.instruction_index)
+        key = (row.date, row.grp, idx)
+        if row.n > 1 or key in seen or (row.grp, idx) not in catalog:
+            return None
+        seen.add(key)
+        followed_by_day[row.date] = followed_by_day.get(row.date, 0) + int(row.followed or 0)
+    return _adherence_days(followed_by_day, len(catalog), date_from, days)
+
+
+def _adherence_days(followed_by_day: dict[date, int], total: int, date_from: date, days: int) -> list[dict]:
+    """Day rows (enhanced-materializer shape, minus instructions) from per-day followed counts."""
+    out = []
+    for i in range(days):
+        d = date_from + timedelta(days=i)
+        followed = followed_by_day.get(d, 0)
+        out.append({
+            "date": d,
+            "followed_count": followed,
+            "unfollowed_count": total - followed,
+            "total": total,
+            "followed_ratio": round(followed / total, 3) if total else 0.0,
+        })
+    return out
+
+
 @app.get("/doctor/patients/{username}/instruction-progress")
 async def patient_instruction_progress(username: str, days: int = 14, db: AsyncSession = Depends(get_db)):
     """Aggregate instruction adherence over the last N days.
 
-    Uses the enhanced materialization logic so "missing" instructions are counted as
+    Fast path: grouped SQL counts against the catalog's expected-identity count.
+    Otherwise uses the enhanced materialization logic so "missing" instructions are counted as
     unfollowed when we can infer the expected instruction set (union-of-observed in the window).
     """
     days = max(1, min(days, 60))  # clamp range
 
-    enhanced = await doctor_instruction_status_enhanced(
-        username=username,
-        days=days,
-        date_from=None,
-        date_to=None,
-        filter_treatment=None,
-        filter_subtype=None,
-        include_unfollowed_placeholders=True,
-        db=db,
-    )
+    res = await db.execute(select(models.Patient).where(models.Patient.username == username))
+    patient = res.scalars().first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
 
-    patient_public = enhanced.get("patient") or {}
-    days_out = enhanced.get("days") or []
+    days_out = await _instruction_progress_aggregate(db, patient, days)
+    if days_out is not None:
+        patient_public = {
+            "username": patient.username,
+            "department": patient.department,
+            "doctor": patient.doctor,
+            "treatment": patient.treatment,
+            "treatment_subtype": patient.treatment_subtype,
+        }
+    else:
+        enhanced = await doctor_instruction_status_enhanced(
+            username=username,
+            days=days,
+            date_from=None,
+            date_to=None,
+            filter_treatment=None,
+            filter_subtype=None,
+            include_unfollowed_placeholders=True,
+            db=db,
+        )
+        patient_public = enhanced.get("patient") or {}
+        days_out = enhanced.get("days") or []
 
     total_followed = 0
     total_unfollowed = 0
@@ -2002,6 +2895,150 @@ async def patient_instruction_progress(username: str, days: int = 14, db: AsyncS
         "daily": daily,
     }
 
+ADHERENCE_SUMMARY_MAX_PATIENTS = 500
+
+
+@app.get("/doctor/patients/adherence-summary")
+async def doctor_patients_adherence_summary(
+    doctor: Optional[str] = None,
+    usernames: Optional[str] = None,
+    days: int = 14,
+    include_daily: bool = True,
+    db: AsyncSession = Depends(get_db),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+):
+    """N-day adherence summaries for many patients in one request.
+
+    Select patients with ?doctor=<name> (same matching as /patients/by-doctor) or
+    ?usernames=a,b,c. At most ADHERENCE_SUMMARY_MAX_PATIENTS patients are scored
+    (lowest ids first); `truncated` is true when more matched.
+
+    All instruction rows in the window come back from a single query returning the
+    newest row per (patient, date, group, instruction_index, text); identities are
+    re-derived from the canonical text as in the enhanced materializer, and when several
+    rows land on one identity for a day the newest (updated_at, then id) wins, as there.
+
+    Scoring per patient (method):
+      - "catalog": treatment has a catalog; every catalog instruction counts each day,
+        followed if its row says so (same rule as instruction-progress).
+      - "observed": no catalog; expected set is the union of instructions seen in the window.
+    """
+    days = max(1, min(days, 60))
+    names = [u.strip() for u in (usernames or "").split(",") if u.strip()]
+    if not names and not doctor:
+        raise HTTPException(status_code=400, detail="Provide doctor or usernames")
+    stmt = select(models.Patient)
+    if names:
+        stmt = stmt.where(models.Patient.username.in_(names))
+    else:
+        stmt = stmt.where(await _doctor_match(db, doctor, models.Patient.doctor_id, models.Patient.doctor))
+    # One extra row tells us whether the list was cut.
+    patients = (await db.execute(stmt.order_by(models.Patient.id).limit(ADHERENCE_SUMMARY_MAX_PATIENTS + 1))).scalars().all()
+    truncated = len(patients) > ADHERENCE_SUMMARY_MAX_PATIENTS
+    patients = patients[:ADHERENCE_SUMMARY_MAX_PATIENTS]
+
+    date_to = date.today()
+    date_from = date_to - timedelta(days=days - 1)
+    # (patient_id) -> {(group, idx): {date: followed}}
+    seen: dict[int, dict[tuple, dict[date, int]]] = {}
+    if patients:
+        ist = models.InstructionStatus
+        dic = models.InstructionDictionary
+        grp = func.lower(func.trim(ist.group))
+        txt = func.coalesce(ist.instruction_text_stored, dic.instruction_text)
+        newest_first = func.row_number().over(
+            partition_by=(ist.patient_id, ist.date, grp, ist.instruction_index, txt),
+            order_by=(ist.updated_at.desc().nulls_last(), ist.id.desc()),
+        )
+        ranked = (
+            select(
+                ist.patient_id,
+                ist.date,
+                grp.label("grp"),
+                ist.instruction_index,
+                txt.label("txt"),
+                case((ist.followed == True, 1), else_=0).label("followed"),
+                ist.updated_at,
+                ist.id,
+                newest_first.label("rn"),
+            )
+            .select_from(ist)
+            .outerjoin(dic, and_(dic.group == ist.group, dic.instruction_index == ist.instruction_index))
+            .where(ist.patient_id.in_([p.id for p in patients]), ist.date >= date_from, ist.date <= date_to)
+            .subquery()
+        )
+        res = await db.execute(select(ranked).where(ranked.c.rn == 1))
+        # (patient_id, identity, date) -> (updated_at, id) of the row counted so far
+        picked: dict[tuple, tuple] = {}
+        for row in res.all():
+            # Same identity rule as instruction-progress: canonical text first, stored index as fallback.
+            key = (row.grp, _canonical_instruction_index(row.grp, row.txt, row.instruction_index))
+            pid = int(row.patient_id)
+            prev = picked.get((pid, key, row.date))
+            if prev is not None:
+                prev_ua, prev_id = prev
+                if row.updated_at is not None and prev_ua is not None:
+                    newer = row.updated_at > prev_ua
+                else:
+                    newer = row.id > prev_id
+                if not newer:
+                    continue
+            picked[(pid, key, row.date)] = (row.updated_at, row.id)
+            seen.setdefault(pid, {}).setdefault(key, {})[row.date] = int(row.followed or 0)
+
+    out = []
+    for p in patients:
+        observed = seen.get(p.id, {})
+        catalog = instruction_catalog.expected_instruction_identities(treatment=p.treatment, subtype=p.treatment_subtype)
+        if catalog:
+            method = "catalog"
+            expected = [k for k in observed if k in catalog]
+            total = len(catalog)
+        else:
+            method = "observed"
+            expected = list(observed)
+            total = len(expected)
+        followed_by_day: dict[date, int] = {}
+        for key in expected:
+            for d, f in observed[key].items():
+                followed_by_day[d] = followed_by_day.get(d, 0) + f
+        daily = _adherence_days(followed_by_day, total, date_from, days)
+        followed_sum = sum(d["followed_count"] for d in daily)
+        total_sum = total * days
+        entry = {
+            "patient_id": p.id,
+            "username": p.username,
+            "name": p.name,
+            "treatment": p.treatment,
+            "subtype": p.treatment_subtype,
+            "method": method,
+            "summary": {
+                "days": days,
+                "followed": followed_sum,
+                "unfollowed": total_sum - followed_sum,
+                "total": total_sum,
+                "followed_ratio": round((followed_sum / total_sum) if total_sum else 0.0, 3),
+            },
+        }
+        if include_daily:
+            entry["daily"] = [
+                {
+                    "date": d["date"].isoformat(),
+                    "followed": d["followed_count"],
+                    "unfollowed": d["unfollowed_count"],
+                    "total": d["total"],
+                    "followed_ratio": d["followed_ratio"],
+                }
+                for d in daily
+            ]
+        out.append(entry)
+    return {
+        "range": {"from": date_from.isoformat(), "to": date_to.isoformat(), "days": days},
+        "count": len(out),
+        "truncated": truncated,
+        "patients": out,
+    }
+
 # ------------------------------------------------------------------
 # Doctor read-only instruction status list for a patient (TEMP: no auth)
 # SECURITY: Protect with doctor auth & assignment validation before production.
@@ -2010,61 +3047,64 @@ async def patient_instruction_progress(username: str, days: int = 14, db: AsyncS
 @app.get("/doctor/patients/{username}/instruction-status", response_model=List[schemas.InstructionStatusResponse])
 async def doctor_list_instruction_status(
     username: str,
+    response: Response,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     filter_treatment: Optional[str] = None,
     filter_subtype: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False,
     db: AsyncSession = Depends(get_db)
 ):
     """Return raw instruction-status rows for the patient.
     Optional filters:
       - date_from / date_to (inclusive)
       - filter_treatment / filter_subtype to scope to current episode treatment
+    Paging/streaming: same limit/cursor/stream parameters as GET /instruction-status.
     """
-    res = await db.execute(select(models.Patient).where(models.Patient.username == username))
-    patient = res.scalars().first()
-    if not patient:
+    res = await db.execute(select(models.Patient.id).where(models.Patient.username == username))
+    patient_id = res.scalar()
+    if patient_id is None:
         raise HTTPException(status_code=404, detail="Patient not found")
-    q = select(models.InstructionStatus).where(models.InstructionStatus.patient_id == patient.id)
+    ist = models.InstructionStatus
+    conds = [ist.patient_id == patient_id]
     if date_from:
-        q = q.where(models.InstructionStatus.date >= date_from)
+        conds.append(ist.date >= date_from)
     if date_to:
-        q = q.where(models.InstructionStatus.date <= date_to)
+        conds.append(ist.date <= date_to)
     if filter_treatment:
-        q = q.where(models.InstructionStatus.treatment == filter_treatment)
+        conds.append(ist.treatment == filter_treatment)
     if filter_subtype:
-        q = q.where(models.InstructionStatus.subtype == filter_subtype)
-    result = await db.execute(
-        q.order_by(
-            models.InstructionStatus.date.desc(),
-            models.InstructionStatus.group.asc(),
-            models.InstructionStatus.instruction_index.asc(),
-        )
-    )
-    return result.scalars().all()
+        conds.append(ist.subtype == filter_subtype)
+    if stream:
+        after = _instruction_history_after(patient_id, cursor)
+        return _ndjson_response(_stream_instruction_history(patient_id, conds, after, max(1, limit) if limit is not None else None))
+    if limit is not None or cursor:
+        return await _instruction_history_page(db, response, patient_id, conds, cursor, limit or INSTR_HISTORY_PAGE_MAX)
+    result = await db.execute(_instruction_history_query(conds, None, None))
+    return result.all()
+
+async def _doctor_patient_or_404(db: AsyncSession, username: str) -> models.Patient:
+    res = await db.execute(select(models.Patient).where(models.Patient.username == username))
+    patient = res.scalars().first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return patient
 
-@app.get("/doctor/patients/{username}/instruction-status/full", response_model=schemas.InstructionStatusFullResponse)
-async def doctor_instruction_status_full(
-    username: str,
+
+async def _instruction_status_full(
+    db: AsyncSession,
+    patient: models.Patient,
     days: int = 14,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     filter_treatment: Optional[str] = None,
     filter_subtype: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
-):
-    """Combined instruction status raw rows + aggregated daily summary for last N days.
-
-    NOTE: Does not yet synthesize missing (unsubmitted) instructions; only returns actual rows.
-    Use filter_treatment / filter_subtype to narrow scope.
-    """
+) -> dict:
+    """Body of /doctor/patients/{username}/instruction-status/full for an already-loaded patient."""
     from datetime import date as _date, timedelta as _td
     days = max(1, min(days, 60))
-    # Patient lookup
-    res = await db.execute(select(models.Patient).where(models.Patient.username == username))
-    patient = res.scalars().first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
 
     # Default window: last N days up to today (legacy behavior).
     # If date_from/date_to are provided, they override days.
@@ -2153,6 +3193,25 @@ async def doctor_instruction_status_full(
     }
 
 
+@app.get("/doctor/patients/{username}/instruction-status/full", response_model=schemas.InstructionStatusFullResponse)
+async def doctor_instruction_status_full(
+    username: str,
+    days: int = 14,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    filter_treatment: Optional[str] = None,
+    filter_subtype: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Combined instruction status raw rows + aggregated daily summary for last N days.
+
+    NOTE: Does not yet synthesize missing (unsubmitted) instructions; only returns actual rows.
+    Use filter_treatment / filter_subtype to narrow scope.
+    """
+    patient = await _doctor_patient_or_404(db, username)
+    return await _instruction_status_full(db, patient, days, date_from, date_to, filter_treatment, filter_subtype)
+
+
 @app.get("/doctor/patients/{username}/episodes", response_model=List[schemas.EpisodeResponse])
 async def doctor_get_patient_episodes(
     username: str,
@@ -2177,33 +3236,19 @@ async def doctor_get_patient_episodes(
     episodes = ep_res.scalars().all()
     return [schemas.EpisodeResponse.model_validate(e, from_attributes=True) for e in episodes]
 
-@app.get("/doctor/patients/{username}/instruction-status/enhanced", response_model=schemas.InstructionStatusEnhancedResponse)
-async def doctor_instruction_status_enhanced(
-    username: str,
+async def _instruction_status_enhanced(
+    db: AsyncSession,
+    patient: models.Patient,
     days: int = 14,
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     filter_treatment: Optional[str] = None,
     filter_subtype: Optional[str] = None,
     include_unfollowed_placeholders: bool = True,
-    db: AsyncSession = Depends(get_db)
-):
-    """Return fully materialized per-day instruction logs for last N days.
-
-        If include_unfollowed_placeholders is true, we attempt to ensure that missing instruction rows
-        are materialized as placeholders (followed=False, synthetic=True) so doctors can see a consistent
-        timeline.
-
-        Materialization order:
-            1) Use a built-in instruction catalog for the patient's treatment/subtype when available.
-            2) Fallback to a union-of-observed heuristic inside the requested window.
-    """
+) -> dict:
+    """Body of /doctor/patients/{username}/instruction-status/enhanced for an already-loaded patient."""
     from datetime import date as _date, timedelta as _td, datetime as _dt
     days = max(1, min(days, 60))
-    res = await db.execute(select(models.Patient).where(models.Patient.username == username))
-    patient = res.scalars().first()
-    if not patient:
-        raise HTTPException(status_code=404, detail="Patient not found")
 
     # Default window: last N days up to today.
     # If date_from/date_to are provided, they override days.
@@ -2402,6 +3447,32 @@ async def doctor_instruction_status_enhanced(
         "generated_at": _dt.utcnow(),
     }
 
+@app.get("/doctor/patients/{username}/instruction-status/enhanced", response_model=schemas.InstructionStatusEnhancedResponse)
+async def doctor_instruction_status_enhanced(
+    username: str,
+    days: int = 14,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    filter_treatment: Optional[str] = None,
+    filter_subtype: Optional[str] = None,
+    include_unfollowed_placeholders: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """Return fully materialized per-day instruction logs for last N days.
+
+        If include_unfollowed_placeholders is true, we attempt to ensure that missing instruction rows
+        are materialized as placeholders (followed=False, synthetic=True) so doctors can see a consistent
+        timeline.
+
+        Materialization order:
+            1) Use a built-in instruction catalog for the patient's treatment/subtype when available.
+            2) Fallback to a union-of-observed heuristic inside the requested window.
+    """
+    patient = await _doctor_patient_or_404(db, username)
+    return await _instruction_status_enhanced(
+        db, patient, days, date_from, date_to, filter_treatment, filter_subtype, include_unfollowed_placeholders
+    )
+
 # ------------------------------------------------------------------
 # Doctor read-only progress entries for a patient (TEMP: no auth)
 # SECURITY: Protect with doctor auth & assignment validation before production.
@@ -2475,53 +3546,68 @@ async def send_chat_message(payload: schemas.ChatMessageCreate, db: AsyncSession
     await db.refresh(msg)
     return msg
 
-@app.post("/instruction-status", response_model=List[schemas.InstructionStatusResponse])
-async def save_instruction_status(payload: schemas.InstructionStatusBulkCreate, db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
+def _instruction_status_rate_policy() -> rate_limit.RateLimitPolicy:
+    # Per-patient burst limit for instruction-status submissions (token bucket).
+    # Environment variables (optional):
+    #   INSTR_STATUS_RATE_WINDOW_SECONDS (default 5)
+    #   INSTR_STATUS_RATE_MAX_REQUESTS (default 12)
+    # i.e. a bucket of MAX_REQUESTS tokens refilled at MAX_REQUESTS per WINDOW; <=0 disables.
+    # Set RATE_LIMIT_BACKEND=db to share buckets across workers.
+    try:
+        window_s = int(os.getenv("INSTR_STATUS_RATE_WINDOW_SECONDS", "5"))
+        max_req = int(os.getenv("INSTR_STATUS_RATE_MAX_REQUESTS", "12"))
+    except Exception:
+        window_s, max_req = 5, 12
+    if window_s <= 0 or max_req <= 0:
+        return rate_limit.RateLimitPolicy("instruction_status", 0, 0)
+    return rate_limit.RateLimitPolicy("instruction_status", max_req, max_req / float(window_s))
+
+
+INSTR_STATUS_RATE_POLICY = _instruction_status_rate_policy()
+
+
+async def _instruction_status_rate_key(current_user: models.Patient = Depends(get_current_user)) -> Optional[int]:
+    # A submission joining an already-open coalescing batch adds no DB write, so it is not charged.
+    # The window is claimed before the limiter is awaited so two concurrent requests
+    # can't both be charged as its opener.
+    coalescer = write_coalescer.instruction_coalescer
+    if coalescer.enabled and not coalescer.opens_window(current_user.id):
+        return None
+    return current_user.id
+
+
+def _instruction_status_rate_denied(patient_id: int) -> None:
+    # Only an admitted request keeps the window; a 429 must not make later taps free.
+    if write_coalescer.instruction_coalescer.enabled:
+        write_coalescer.instruction_coalescer.release_window(patient_id)
+
+
+@app.post(
+    "/instruction-status",
+    response_model=List[schemas.InstructionStatusUpsertResponse],
+    dependencies=[Depends(rate_limit.rate_limit(
+        INSTR_STATUS_RATE_POLICY,
+        key=_instruction_status_rate_key,
+        detail="Too many instruction-status submissions; please retry shortly.",
+        on_denied=_instruction_status_rate_denied,
+    ))],
+)
+async def save_instruction_status(payload: schemas.InstructionStatusBulkCreate, response: Response, db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
     """Idempotent upsert for instruction status rows.
 
     Reliability changes:
       * Removes destructive per-(date,group) delete cycles (previous churn source).
-      * Uses PostgreSQL ON CONFLICT to update existing rows in-place.
+      * Uses ON CONFLICT (Postgres or SQLite, see instruction_upsert) to update existing rows in-place.
       * Unique index (patient_id, date, group, instruction_index) enforced at startup.
+      * Items identical to the stored row are not rewritten (updated_at unchanged).
 
-    Returns the freshly persisted rows corresponding to submitted items.
+    Returns the persisted rows corresponding to submitted items; `changed` is false for
+    items that were no-ops. Header X-Instruction-Changed carries the changed count.
     """
     await _rotate_if_due(db, current_user)
 
-    # Lightweight in-memory rate limiting (per patient) to suppress accidental rapid bursts
-    # Environment variables (optional):
-    #   INSTR_STATUS_RATE_WINDOW_SECONDS (default 5)
-    #   INSTR_STATUS_RATE_MAX_REQUESTS (default 12)
-    # This is a best-effort, in-process limiter. For multi-worker deployments replace with Redis.
-    try:
-        import os, time
-        window_s = int(os.getenv("INSTR_STATUS_RATE_WINDOW_SECONDS", "5"))
-        max_req = int(os.getenv("INSTR_STATUS_RATE_MAX_REQUESTS", "12"))
-        if window_s > 0 and max_req > 0:
-            now = time.time()
-            bucket = _instruction_rate_limiter.setdefault(current_user.id, [])  # type: ignore  # defined below
-            # Drop timestamps outside window
-            cutoff = now - window_s
-            i = 0
-            while i < len(bucket):
-                if bucket[i] < cutoff:
-                    i += 1
-                else:
-                    break
-            if i > 0:
-                del bucket[:i]
-            if len(bucket) >= max_req:
-                # Too many in window -> 429
-                from fastapi import Response
-                retry_after = max(1, int(cutoff + window_s - now))
-                raise HTTPException(status_code=429, detail="Too many instruction-status submissions; please retry shortly.")
-            bucket.append(now)
-    except HTTPException:
-        raise
-    except Exception:
-        # Fail open on limiter errors
-        pass
     if not payload.items:
+        response.headers["X-Instruction-Changed"] = "0"
         return []
 
     # Normalize & collapse duplicates inside the same payload (last wins)
@@ -2531,44 +3617,23 @@ async def save_instruction_status(payload: schemas.InstructionStatusBulkCreate,
         collapsed[key] = item  # overwrite if repeated
 
     # Upsert with sticky ever_followed logic: once true, always true.
-    upsert_sql = text(
-        """
-        INSERT INTO instruction_status (patient_id, date, treatment, subtype, "group", instruction_index, instruction_text, followed, ever_followed, updated_at)
-        VALUES (:patient_id, :date, :treatment, :subtype, :group, :instruction_index, :instruction_text, :followed, :ever_followed, NOW())
-        ON CONFLICT (patient_id, date, "group", instruction_index)
-        DO UPDATE SET
-          treatment = EXCLUDED.treatment,
-          subtype = EXCLUDED.subtype,
-          instruction_text = EXCLUDED.instruction_text,
-          followed = EXCLUDED.followed,
-          ever_followed = (instruction_status.ever_followed OR EXCLUDED.ever_followed),
-          updated_at = NOW()
-        RETURNING id, patient_id, date, treatment, subtype, "group", instruction_index, instruction_text, followed, ever_followed, updated_at;
-        """
-    )
-
-    returned_rows = []
-    for (_d, _g, _idx), item in collapsed.items():
-        params = {
-            "patient_id": current_user.id,
-            "date": item.date,
-            "treatment": item.treatment or "",
-            "subtype": item.subtype,
-            "group": item.group,
-            "instruction_index": item.instruction_index,
-            "instruction_text": item.instruction_text,
-            "followed": item.followed,
-            "ever_followed": (item.followed is True),
-        }
-        res = await db.execute(upsert_sql, params)
-        row = res.first()
-        if row:
-            returned_rows.append(row)
-    await db.commit()
+    # All collapsed items go out as one multi-row statement (chunked for very large
+    # offline catch-up payloads); instruction_upsert emits the right dialect form.
+    # With INSTR_STATUS_COALESCE_MS set, rapid taps are merged into one per-patient batch.
+    if write_coalescer.instruction_coalescer.enabled:
+        # End this request's transaction first: its connection goes back to the pool
+        # while we wait, so the batch flush (its own session) can always get one.
+        await db.commit()
+        returned_rows = await write_coalescer.instruction_coalescer.submit(current_user.id, collapsed.values())
+    else:
+        returned_rows = await instruction_upsert.upsert_instruction_statuses(db, current_user.id, collapsed.values())
+        await db.commit()
 
     # Shape rows into response models
     out = []
-    for r in returned_rows:
+    changed_count = 0
+    for r, changed in returned_rows:
+        changed_count += 1 if changed else 0
         out.append({
             "id": r.id,
             "patient_id": r.patient_id,
@@ -2581,7 +3646,10 @@ async def save_instruction_status(payload: schemas.InstructionStatusBulkCreate,
             "followed": r.followed,
             "ever_followed": getattr(r, 'ever_followed', None),
             "updated_at": getattr(r, 'updated_at', None),
+            "change_seq": getattr(r, 'change_seq', None),
+            "changed": changed,
         })
+    response.headers["X-Instruction-Changed"] = str(changed_count)
     return out
 
 @app.get("/doctor/patients/{username}/instruction-status-debug")
@@ -2619,6 +3687,10 @@ async def doctor_patient_info(username: str, db: AsyncSession = Depends(get_db),
     patient = res.scalars().first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
+    return _doctor_patient_info(patient)
+
+
+def _doctor_patient_info(patient: models.Patient) -> dict:
     return {
         "username": patient.username,
         "name": patient.name,
@@ -2633,58 +3705,46 @@ async def doctor_patient_info(username: str, db: AsyncSession = Depends(get_db),
 
 @app.get("/completed-patients", response_model=List[schemas.CompletedPatientRow])
 async def list_completed_patients(
+    response: Response,
     username: Optional[str] = None,
     email: Optional[str] = None,
     phone: Optional[str] = None,
     limit: int = 200,
     offset: int = 0,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
     current_doctor: models.Doctor = Depends(get_current_doctor),
 ):
-    """Read-only list of completed procedures.
+    """Read-only list of completed procedures, newest episode first.
 
-    This reads from the DB view `completed_patients` (one row per completed+locked episode).
+    Reads the indexed completed_patient_episodes table (same rows as the DB view
+    `completed_patients`: one row per completed+locked episode).
     Duplicates by phone/email are expected because this is historical.
+
+    Paging: pass X-Next-Cursor back as ?cursor= (keyset on episode_id). ?offset=
+    still works for older clients.
     """
     limit = max(1, min(int(limit or 200), 500))
-    offset = max(0, int(offset or 0))
-
-    base_sql = """
-        SELECT
-          episode_id,
-          patient_id,
-          username,
-          name,
-          phone,
-          email,
-          department,
-          doctor,
-          treatment,
-          treatment_subtype,
-          procedure_date,
-          procedure_time,
-          episode_created_at,
-          patient_last_completed_at
-        FROM completed_patients
-    """
-    clauses: list[str] = []
-    params: dict[str, Any] = {"limit": limit, "offset": offset}
+    cpe = models.CompletedPatientEpisode.__table__
+    stmt = select(cpe)
     if username:
-        clauses.append("username = :username")
-        params["username"] = username
+        stmt = stmt.where(cpe.c.username == username)
     if email:
-        clauses.append("email = :email")
-        params["email"] = email
+        stmt = stmt.where(cpe.c.email == email)
     if phone:
-        clauses.append("phone = :phone")
-        params["phone"] = phone
-
-    where_sql = (" WHERE " + " AND ".join(clauses)) if clauses else ""
-    order_sql = " ORDER BY episode_id DESC"
-    page_sql = " LIMIT :limit OFFSET :offset"
-    stmt = text(base_sql + where_sql + order_sql + page_sql)
-    res = await db.execute(stmt, params)
+        stmt = stmt.where(cpe.c.phone == phone)
+    if cursor:
+        data = _decode_cursor(cursor)
+        if not isinstance(data.get("e"), int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(cpe.c.episode_id < data["e"])
+    else:
+        stmt = stmt.offset(max(0, int(offset or 0)))
+    res = await db.execute(stmt.order_by(cpe.c.episode_id.desc()).limit(limit + 1))
     rows = res.mappings().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor({"e": int(rows[-1]["episode_id"])})
     return [schemas.CompletedPatientRow(**dict(r)) for r in rows]
 
 
@@ -2719,54 +3779,277 @@ async def doctor_send_chat_message(username: str, payload: schemas.DoctorChatMes
     await db.refresh(msg)
     return msg
 
+# --- Doctor patient overview: one round trip for the patient screen ---
+DOCTOR_OVERVIEW_SECTIONS = ("info", "episodes", "instructions", "progress", "chat")
+
+
+def _doctor_overview_parallelism() -> int:
+    try:
+        return max(1, int(os.getenv("DOCTOR_OVERVIEW_PARALLELISM", "4")))
+    except Exception:
+        return 4
+
+
+@app.get("/doctor/patients/{username}/overview", response_model=schemas.DoctorPatientOverview)
+async def doctor_patient_overview(
+    username: str,
+    include: Optional[str] = None,
+    instructions: str = "enhanced",
+    days: int = 14,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    filter_treatment: Optional[str] = None,
+    filter_subtype: Optional[str] = None,
+    include_unfollowed_placeholders: bool = True,
+    db: AsyncSession = Depends(get_db),
+    current_doctor: models.Doctor = Depends(get_current_doctor),
+):
+    """Everything the doctor patient screen needs in one response.
+
+    Same data as /info, /episodes, /instruction-status/enhanced (or /full with
+    ?instructions=full), /progress and /chat. The patient is looked up once;
+    the sections then run concurrently, each on its own pooled session
+    (at most DOCTOR_OVERVIEW_PARALLELISM at a time, default 4).
+
+    ?include=info,episodes,... picks sections (default: all). A section that
+    fails is left null and its error is reported under "errors"; bad
+    parameters (e.g. an invalid date range) still fail the whole request.
+    """
+    if include is None:
+        sections = list(DOCTOR_OVERVIEW_SECTIONS)
+    else:
+        wanted = {s.strip().lower() for s in include.split(",") if s.strip()}
+        unknown = sorted(wanted - set(DOCTOR_OVERVIEW_SECTIONS))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}")
+        sections = [s for s in DOCTOR_OVERVIEW_SECTIONS if s in wanted]
+    instructions = (instructions or "enhanced").strip().lower()
+    if instructions not in {"enhanced", "full"}:
+        raise HTTPException(status_code=400, detail="instructions must be 'enhanced' or 'full'")
+
+    patient = await _doctor_patient_or_404(db, username)
+    patient_id = int(object.__getattribute__(patient, 'id'))
+
+    async def _episodes(s: AsyncSession):
+        te = models.TreatmentEpisode
+        rows = (await s.execute(select(te).where(te.patient_id == patient_id).order_by(te.id.desc()))).scalars().all()
+        return [schemas.EpisodeResponse.model_validate(e, from_attributes=True) for e in rows]
+
+    async def _instructions(s: AsyncSession):
+        if instructions == "full":
+            return await _instruction_status_full(s, patient, days, date_from, date_to, filter_treatment, filter_subtype)
+        return await _instruction_status_enhanced(
+            s, patient, days, date_from, date_to, filter_treatment, filter_subtype, include_unfollowed_placeholders
+        )
+
+    async def _progress(s: AsyncSession):
+        pr = models.Progress
+        rows = (await s.execute(select(pr).where(pr.patient_id == patient_id).order_by(pr.timestamp.desc()))).scalars().all()
+        return [schemas.ProgressEntry.model_validate(r, from_attributes=True) for r in rows]
+
+    async def _chat(s: AsyncSession):
+        cm = models.ChatMessage
+        rows = (await s.execute(select(cm).where(cm.patient_id == patient_id).order_by(cm.created_at.asc()))).scalars().all()
+        return [schemas.ChatMessage.model_validate(r, from_attributes=True) for r in rows]
+
+    loaders = {"episodes": _episodes, "instructions": _instructions, "progress": _progress, "chat": _chat}
+    gate = asyncio.Semaphore(_doctor_overview_parallelism())
+
+    async def _run(loader):
+        async with gate:
+            async with AsyncSessionLocal() as s:
+                return await loader(s)
+
+    out: dict[str, Any] = {"username": patient.username, "sections": sections, "errors": {}}
+    if "info" in sections:
+        out["info"] = _doctor_patient_info(patient)
+    pending = [name for name in sections if name in loaders]
+    results = await asyncio.gather(*(_run(loaders[name]) for name in pending), return_exceptions=True)
+    for name, result in zip(pending, results):
+        if isinstance(result, HTTPException):
+            raise result
+        if isinstance(result, BaseException):
+            print(f"[doctor/overview] section {name} failed for {username}: {result}")
+            out["errors"][name] = str(result) or type(result).__name__
+            continue
+        out["instruction_status" if name == "instructions" else name] = result
+    return out
+
+# --- Instruction-status history: keyset pages (date DESC, group, index) and NDJSON streaming ---
+INSTR_HISTORY_PAGE_MAX = 5000
+
+
+def _instruction_history_order() -> list[tuple[Any, bool]]:
+    ist = models.InstructionStatus
+    return [(ist.date, True), (ist.group, False), (ist.instruction_index, False)]
+
+
+def _instruction_history_columns() -> tuple:
+    ist = models.InstructionStatus
+    return (
+        ist.id, ist.patient_id, ist.date, ist.treatment, ist.subtype, ist.group, ist.instruction_index,
+        ist.instruction_text.label("instruction_text"), ist.followed, ist.ever_followed, ist.updated_at, ist.change_seq,
+    )
+
+
+def _instruction_history_after(patient_id: int, cursor: Optional[str]) -> Optional[list[Any]]:
+    """Decode a history cursor into [date, group, instruction_index] (None = first page)."""
+    if not cursor:
+        return None
+    data = _decode_cursor(cursor)
+    key = data.get("k")
+    if data.get("p") != patient_id or not isinstance(key, list) or len(key) != 3:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return [date.fromisoformat(key[0]), str(key[1]), int(key[2])]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _instruction_history_query(conds: list, after: Optional[list[Any]], limit: Optional[int]):
+    order = _instruction_history_order()
+    q = select(*_instruction_history_columns()).where(*conds)
+    if after is not None:
+        q = q.where(_keyset_after(order, after))
+    q = q.order_by(*[col.desc() if descending else col.asc() for col, descending in order])
+    return q.limit(limit) if limit is not None else q
+
+
+def _instruction_history_cursor(patient_id: int, row: Any) -> str:
+    return _encode_cursor({"p": patient_id, "k": [row.date.isoformat(), row.group, int(row.instruction_index)]})
+
+
+async def _instruction_history_page(
+    db: AsyncSession, response: Response, patient_id: int, conds: list, cursor: Optional[str], limit: int,
+) -> list[Any]:
+    """One keyset page; sets X-Next-Cursor (absent on the last page) and X-Has-More."""
+    limit = max(1, min(limit, INSTR_HISTORY_PAGE_MAX))
+    res = await db.execute(_instruction_history_query(conds, _instruction_history_after(patient_id, cursor), limit + 1))
+    rows = res.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        response.headers["X-Next-Cursor"] = _instruction_history_cursor(patient_id, rows[-1])
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    return rows
+
+
+async def _stream_instruction_history(
+    patient_id: int, conds: list, after: Optional[list[Any]], limit: Optional[int],
+) -> AsyncIterator[dict[str, Any]]:
+    """Rows straight off a server-side cursor; the summary carries next_cursor when limit cut the stream."""
+    count = 0
+    last = None
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(_instruction_history_query(conds, after, limit))
+        async for r in result:
+            count += 1
+            last = r
+            yield {"type": "instruction_status", **dict(r._mapping)}
+    next_cursor = _instruction_history_cursor(patient_id, last) if (limit is not None and last is not None and count >= limit) else None
+    yield {"type": "summary", "count": count, "next_cursor": next_cursor}
+
+
 @app.get("/instruction-status", response_model=List[schemas.InstructionStatusResponse])
-async def list_instruction_status(date_from: Optional[date] = None, date_to: Optional[date] = None, db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
-    q = select(models.InstructionStatus).where(models.InstructionStatus.patient_id == current_user.id)
+async def list_instruction_status(
+    request: Request,
+    response: Response,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.Patient = Depends(get_current_user),
+):
+    """Patient's instruction-status rows, newest date first (then group, index).
+
+    Without limit/cursor the whole range is returned (legacy clients). With
+    ?limit=N rows come in keyset pages: pass X-Next-Cursor back as ?cursor=.
+    ?stream=1 sends NDJSON rows as they are read, then a summary line.
+    """
+    ist = models.InstructionStatus
+    conds = [ist.patient_id == current_user.id]
     if date_from:
-        q = q.where(models.InstructionStatus.date >= date_from)
+        conds.append(ist.date >= date_from)
     if date_to:
-        q = q.where(models.InstructionStatus.date <= date_to)
-    result = await db.execute(
-        q.order_by(
-            models.InstructionStatus.date.desc(),
-            models.InstructionStatus.group.asc(),
-            models.InstructionStatus.instruction_index.asc(),
-        )
+        conds.append(ist.date <= date_to)
+    if stream:
+        after = _instruction_history_after(current_user.id, cursor)
+        return _ndjson_response(_stream_instruction_history(current_user.id, conds, after, max(1, limit) if limit is not None else None))
+    # Every write bumps the patient's change_seq, so max(change_seq) changes even when two
+    # edits land within updated_at's resolution (one second on SQLite).
+    etag = await _table_etag(
+        db, f"instruction-status:{current_user.id}:{date_from}:{date_to}:{limit}:{cursor}", ist, *conds,
+        changed_col=ist.change_seq,
     )
-    return result.scalars().all()
+    if limit is not None or cursor:
+        # The page is read first so a 304 still carries X-Next-Cursor / X-Has-More.
+        rows = await _instruction_history_page(db, response, current_user.id, conds, cursor, limit or INSTR_HISTORY_PAGE_MAX)
+        not_modified = _conditional(request, response, etag)
+        if not_modified is not None:
+            for name in ("X-Next-Cursor", "X-Has-More"):
+                if name in response.headers:
+                    not_modified.headers[name] = response.headers[name]
+            return not_modified
+        return rows
+    not_modified = _conditional(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    result = await db.execute(_instruction_history_query(conds, None, None))
+    return result.all()
+
+INSTR_CHANGES_PAGE_MAX = 2000
+
 
 @app.get("/instruction-status/changes", response_model=List[schemas.InstructionStatusResponse])
 async def list_instruction_status_changes(
-    since: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = 500,
     db: AsyncSession = Depends(get_db),
     current_user: models.Patient = Depends(get_current_user),
 ):
-    """Return instruction status rows updated AFTER the provided ISO8601 timestamp (UTC).
-    Example since: "2025-08-01T00:00:00Z" or "2025-08-01T00:00:00+00:00"
-    """
-    try:
-        from datetime import datetime, timezone as _dt_tz
-        # Accept both Z and explicit offset forms
-        parsed = datetime.fromisoformat(since.replace("Z", "+00:00"))
-        # Convert to naive UTC to match TIMESTAMP WITHOUT TIME ZONE columns
-        if parsed.tzinfo is not None:
-            since_dt = parsed.astimezone(_dt_tz.utc).replace(tzinfo=None)
-        else:
-            # Treat naive input as UTC already
-            since_dt = parsed
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid 'since' timestamp")
+    """Instruction status rows changed after `cursor`, oldest change first.
 
-    q = (
-        select(models.InstructionStatus)
-        .where(
-            models.InstructionStatus.patient_id == current_user.id,
-            models.InstructionStatus.updated_at > since_dt,
-        )
-        .order_by(models.InstructionStatus.updated_at.asc())
-    )
-    res = await db.execute(q)
+    Rows are ordered by their per-patient change_seq; pass the X-Next-Cursor
+    response header back as ?cursor= to get the next page (X-Has-More: true
+    means call again right away). No cursor = from the beginning.
+
+    Legacy: ?since=<ISO8601 UTC> (e.g. "2025-08-01T00:00:00Z") still filters on
+    updated_at > since for the first page; follow-up pages use the cursor.
+    """
+    limit = max(1, min(limit, INSTR_CHANGES_PAGE_MAX))
+    ist = models.InstructionStatus
+    q = select(ist).where(ist.patient_id == current_user.id)
+    after_seq = 0
+    if cursor:
+        data = _decode_cursor(cursor)
+        if data.get("p") != current_user.id or not isinstance(data.get("s"), int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after_seq = data["s"]
+    elif since:
+        try:
+            from datetime import timezone as _dt_tz
+            # Accept both Z and explicit offset forms
+            parsed = datetime.fromisoformat(since.replace("Z", "+00:00"))
+            # Convert to naive UTC to match TIMESTAMP WITHOUT TIME ZONE columns
+            if parsed.tzinfo is not None:
+                since_dt = parsed.astimezone(_dt_tz.utc).replace(tzinfo=None)
+            else:
+                # Treat naive input as UTC already
+                since_dt = parsed
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid 'since' timestamp")
+        q = q.where(ist.updated_at > since_dt)
+    res = await db.execute(q.where(ist.change_seq > after_seq).order_by(ist.change_seq.asc()).limit(limit + 1))
     rows = res.scalars().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    last_seq = int(rows[-1].change_seq) if rows else after_seq
+    response.headers["X-Next-Cursor"] = _encode_cursor({"p": current_user.id, "s": last_seq})
+    response.headers["X-Has-More"] = "true" if has_more else "false"
     # Response models will be built from attributes (schemas.from_attributes)
     return rows
 
@@ -2778,6 +4061,7 @@ async def save_department_doctor(data: schemas.DepartmentDoctorSelection, db: As
         raise HTTPException(status_code=423, detail="Episode is locked and cannot be modified.")
     object.__setattr__(ep, 'department', data.department)
     object.__setattr__(ep, 'doctor', data.doctor)
+    object.__setattr__(ep, 'doctor_id', await doctor_directory.resolve(db, data.doctor))
     db.add(ep)
     await db.commit()
     await db.refresh(ep)
@@ -2811,8 +4095,14 @@ async def get_current_episode(db: AsyncSession = Depends(get_db), current_user:
     return schemas.CurrentEpisodeResponse.model_validate(ep, from_attributes=True)
 
 @app.get("/episodes/history", response_model=List[schemas.EpisodeResponse])
-async def get_episode_history(db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
-    stmt = select(models.TreatmentEpisode).where(models.TreatmentEpisode.patient_id == object.__getattribute__(current_user, 'id')).order_by(models.TreatmentEpisode.id.desc())
+async def get_episode_history(request: Request, response: Response, db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
+    te = models.TreatmentEpisode
+    pid = object.__getattribute__(current_user, 'id')
+    etag = await _table_etag(db, f"episodes/history:{pid}", te, te.patient_id == pid, changed_col=func.coalesce(te.updated_at, te.created_at))
+    not_modified = _conditional(request, response, etag)
+    if not_modified is not None:
+        return not_modified
+    stmt = select(te).where(te.patient_id == pid).order_by(te.id.desc())
     res = await db.execute(stmt)
     episodes = res.scalars().all()
     return [schemas.EpisodeResponse.model_validate(e, from_attributes=True) for e in episodes]
@@ -2847,6 +4137,7 @@ async def mark_episode_complete(payload: schemas.MarkCompleteRequest, db: AsyncS
         db.add(current_user)
         await db.commit()
         await db.refresh(current_user)
+        await _invalidate_patient_dashboards(current_user)
     except Exception as _e:
         # Best-effort only; don't block completion if the DB hasn't been migrated yet.
         print(f"[episodes/mark-complete] patient completion marker write skipped: {_e}")
@@ -2857,6 +4148,7 @@ async def mark_episode_complete(payload: schemas.MarkCompleteRequest, db: AsyncS
         # Preserve assignment to keep /patients/by-doctor stable after completion.
         department=getattr(ep, 'department', None) or getattr(current_user, 'department', None),
         doctor=getattr(ep, 'doctor', None) or getattr(current_user, 'doctor', None),
+        doctor_id=getattr(ep, 'doctor_id', None) or getattr(current_user, 'doctor_id', None),
         treatment=None,
         subtype=None,
         procedure_completed=False,
@@ -2922,6 +4214,7 @@ async def start_new_episode(
         db.add(current_user)
         await db.commit()
         await db.refresh(current_user)
+        await _invalidate_patient_dashboards(current_user)
     except Exception as _e:
         print(f"[episodes/start-new] patient completion marker write skipped: {_e}")
 
@@ -2930,6 +4223,7 @@ async def start_new_episode(
         # Preserve assignment to keep doctor dashboards stable.
         department=getattr(ep, 'department', None) or getattr(current_user, 'department', None),
         doctor=getattr(ep, 'doctor', None) or getattr(current_user, 'doctor', None),
+        doctor_id=getattr(ep, 'doctor_id', None) or getattr(current_user, 'doctor_id', None),
         treatment=None,
         subtype=None,
         procedure_completed=False,
@@ -3011,6 +4305,7 @@ async def replace_treatment_episode(
         patient_id=current_user.id,
         department=getattr(current_user, 'department', None),
         doctor=getattr(current_user, 'doctor', None),
+        doctor_id=getattr(current_user, 'doctor_id', None),
         treatment=payload.treatment,
         subtype=payload.subtype,
         procedure_date=payload.procedure_date,
@@ -4253,7 +5548,11 @@ async def create_reminder(
     return row
 
 @app.get("/reminders", response_model=list[schemas.ReminderResponse])
-async def list_reminders(db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
+async def list_reminders(request: Request, response: Response, db: AsyncSession = Depends(get_db), current_user: models.Patient = Depends(get_current_user)):
+    etag = await _table_etag(db, f"reminders:{current_user.id}", models.Reminder, models.Reminder.patient_id == current_user.id)
+    not_modified = _conditional(request, response, etag)
+    if not_modified is not None:
+        return not_modified
     res = await db.execute(select(models.Reminder).where(models.Reminder.patient_id == current_user.id).order_by(models.Reminder.next_fire_utc.asc()))
     return res.scalars().all()
 
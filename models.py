@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Boolean, Time
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Boolean, Time, Float, LargeBinary
 from sqlalchemy import UniqueConstraint
 from sqlalchemy import Index
-from sqlalchemy.orm import relationship
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import column_property, relationship
 from datetime import datetime
 
 from database import Base
@@ -22,6 +23,8 @@ class Patient(Base):
     password = Column(String, nullable=False)
     department = Column(String, nullable=True)
     doctor = Column(String, nullable=True)
+    # Resolved from the free-text doctor name (doctor_directory); what dashboards filter on.
+    doctor_id = Column(Integer, ForeignKey("doctors.id", ondelete="SET NULL"), nullable=True, index=True)
     treatment = Column(String, nullable=True)
     treatment_subtype = Column(String, nullable=True)
     procedure_date = Column(Date, nullable=True)
@@ -34,6 +37,11 @@ class Patient(Base):
     ever_completed = Column(Boolean, default=False, nullable=False)
     last_completed_episode_id = Column(Integer, nullable=True)
     last_completed_at = Column(DateTime, nullable=True)
+    # Cached earliest date _rotate_if_due can act on the open episode (date.max = not due).
+    # Maintained by _mirror_episode_to_patient; NULL means unknown -> full check.
+    rotation_due_on = Column(Date, nullable=True)
+    # Last change_seq handed out to this patient's instruction_status writes.
+    instruction_change_seq = Column(BigInteger, default=0, nullable=False)
     is_verified = Column(Boolean, default=False, nullable=False)
 
     # UI preferences (synced across devices via account)
@@ -59,10 +67,16 @@ class Patient(Base):
 
 class TreatmentEpisode(Base):
     __tablename__ = "treatment_episodes"
+    __table_args__ = (
+        # Keyset pages of /patients/by-doctor-episodes (sort=recent / sort=procedure_date).
+        Index("ix_treatment_episodes_doctor_id_id", "doctor_id", "id"),
+        Index("ix_treatment_episodes_doctor_id_procedure_date", "doctor_id", text("coalesce(procedure_date, '0001-01-01')"), "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
     department = Column(String, nullable=True)
     doctor = Column(String, nullable=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id", ondelete="SET NULL"), nullable=True, index=True)
     treatment = Column(String, nullable=True)
     subtype = Column(String, nullable=True)
     procedure_date = Column(Date, nullable=True)
@@ -70,8 +84,44 @@ class TreatmentEpisode(Base):
     procedure_completed = Column(Boolean, default=False, nullable=False)
     locked = Column(Boolean, default=False, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Bumped on every ORM/Core UPDATE; feeds the /episodes/history ETag.
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
     patient = relationship("Patient", back_populates="episodes")
 
+class PatientLatestEpisode(Base):
+    """Each patient's latest episode with a non-empty treatment (maintained by latest_episodes)."""
+    __tablename__ = "patient_latest_episodes"
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True)
+    episode_id = Column(Integer, ForeignKey("treatment_episodes.id", ondelete="CASCADE"), nullable=False)
+    department = Column(String, nullable=True)
+    doctor = Column(String, nullable=True)
+    doctor_id = Column(Integer, nullable=True)
+    treatment = Column(String, nullable=True)
+    subtype = Column(String, nullable=True)
+    procedure_date = Column(Date, nullable=True)
+    procedure_time = Column(Time, nullable=True)
+    procedure_completed = Column(Boolean, nullable=True)
+    locked = Column(Boolean, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class CompletedPatientEpisode(Base):
+    """Indexed copy of the completed_patients view (completed_episodes keeps it current)."""
+    __tablename__ = "completed_patient_episodes"
+    episode_id = Column(Integer, ForeignKey("treatment_episodes.id", ondelete="CASCADE"), primary_key=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
+    username = Column(String, nullable=False, index=True)
+    name = Column(String, nullable=False)
+    phone = Column(String, nullable=False, index=True)
+    email = Column(String, nullable=False, index=True)
+    department = Column(String, nullable=True)
+    doctor = Column(String, nullable=True)
+    treatment = Column(String, nullable=True)
+    treatment_subtype = Column(String, nullable=True)
+    procedure_date = Column(Date, nullable=True)
+    procedure_time = Column(Time, nullable=True)
+    episode_created_at = Column(DateTime, nullable=False)
+    patient_last_completed_at = Column(DateTime, nullable=True)
+
 class Doctor(Base):
     __tablename__ = "doctors"
     id = Column(Integer, primary_key=True, index=True)
@@ -154,8 +204,26 @@ class ChatMessage(Base):
 
     patient = relationship("Patient")
 
+class InstructionDictionary(Base):
+    """Shared instruction texts keyed by (group, stable FNV instruction_index).
+
+    instruction_status rows whose text matches the entry store NULL and read the
+    text through InstructionStatus.instruction_text (see instruction_dictionary.py).
+    """
+    __tablename__ = "instruction_dictionary"
+    group = Column(String, primary_key=True)
+    instruction_index = Column(Integer, primary_key=True)
+    instruction_text = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 class InstructionStatus(Base):
     __tablename__ = "instruction_status"
+    __table_args__ = (
+        # Conflict target for the instruction-status upsert (also ensured at startup).
+        Index("ux_instruction_identity", "patient_id", "date", "group", "instruction_index", unique=True),
+        # Cursor scans for /instruction-status/changes.
+        Index("ix_instruction_status_patient_change_seq", "patient_id", "change_seq"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     date = Column(Date, nullable=False)
@@ -163,7 +231,18 @@ class InstructionStatus(Base):
     subtype = Column(String, nullable=True)
     group = Column(String, nullable=False)
     instruction_index = Column(Integer, nullable=False)
-    instruction_text = Column(String, nullable=False)
+    # Stored text; NULL when it equals the instruction_dictionary entry for (group, instruction_index).
+    instruction_text_stored = Column("instruction_text", String, nullable=True)
+    # Read-only expanded text (stored value, else dictionary text). Writes go through instruction_upsert.
+    instruction_text = column_property(
+        func.coalesce(
+            instruction_text_stored,
+            select(InstructionDictionary.instruction_text)
+            .where(InstructionDictionary.group == group, InstructionDictionary.instruction_index == instruction_index)
+            .correlate_except(InstructionDictionary)
+            .scalar_subquery(),
+        )
+    )
     followed = Column(Boolean, default=False)
     # New: tracks if instruction was EVER followed at least once historically.
     # This value becomes sticky (once true it never reverts to false) and is
@@ -171,6 +250,8 @@ class InstructionStatus(Base):
     ever_followed = Column(Boolean, default=False, nullable=False)
     # Updated timestamp for multi-device sync (server authoritative clock)
     updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Per-patient, strictly increasing on every write (patients.instruction_change_seq).
+    change_seq = Column(BigInteger, nullable=True)
     patient = relationship("Patient", back_populates="instruction_statuses")
 
 class ScheduledPush(Base):
@@ -209,7 +290,8 @@ class Reminder(Base):
     last_ack_local_date = Column(Date, nullable=True)  # date (in user tz) we received an acknowledgement to suppress fallback that day
     grace_minutes = Column(Integer, default=20, nullable=False)     # suppress push until grace window passes
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # onupdate: dispatcher writes (next_fire_utc, last_sent_utc, ...) must also move the /reminders ETag.
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     # Delivery instrumentation & retry state (new)
     attempts_today = Column(Integer, default=0, nullable=False)
     last_attempt_utc = Column(DateTime, nullable=True)
@@ -236,4 +318,35 @@ class AdherenceNudge(Base):
     status = Column(String, nullable=True)  # sent|no_tokens|failed|skipped
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    patient = relationship("Patient")
\ No newline at end of file
+    patient = relationship("Patient")
+
+class RateLimitBucket(Base):
+    """Shared token-bucket state for rate_limit.SqlRateLimitBackend (one row per limited key)."""
+    __tablename__ = "rate_limit_buckets"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Epoch seconds of the last refill; Float keeps the arithmetic dialect-neutral.
+    refreshed_at = Column(Float, nullable=False)
+    # Outcome of the most recent take, returned by the atomic upsert.
+    last_allowed = Column(Boolean, nullable=False, default=True)
+
+
+class IdempotencyRecord(Base):
+    """Stored response for an Idempotency-Key (idempotency.DbIdempotencyStore)."""
+    __tablename__ = "idempotency_records"
+    # sha256 of method + path + caller credential + client key
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # sha256 of the request body
+    status_code = Column(Integer, nullable=False)
+    headers = Column(String, nullable=True)  # JSON list of [name, value]
+    body = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class ResponseCacheEntry(Base):
+    """Shared dashboard response cache entry (response_cache.DbResponseCache)."""
+    __tablename__ = "response_cache_entries"
+    scope = Column(String, primary_key=True)  # e.g. "doctor:12"; invalidation deletes by scope
+    key = Column(String, primary_key=True)    # endpoint path + sorted query params
+    body = Column(LargeBinary, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,155 @@
+"""Indexed patient search over name, username, email and phone.
+
+The backend is picked once at startup by ensure_indexes():
+  * trigram (Postgres + pg_trgm): GIN trigram indexes on lower(name/username/email)
+    and phone serve LIKE '%q%' substring matches. Ranking uses similarity().
+  * fts5 (SQLite): an external-content FTS5 table using the trigram tokenizer
+    (patients_search_fts), kept in sync by triggers on patients. Ranking uses bm25().
+  * prefix (anything else, or pg_trgm not installable): case-insensitive prefix
+    matches on each field and on the start of any word of the name, backed by
+    expression indexes on Postgres.
+Queries shorter than MIN_SUBSTRING_CHARS always use prefix matching, because
+trigram indexes cannot serve them.
+
+Exact username/email/phone hits rank first, then prefix hits, then the rest by
+the backend's relevance score; ties break on patient id.
+"""
+
+from typing import Any
+
+from sqlalchemy import case, column, func, literal, literal_column, or_, select, table, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+import models
+
+MIN_SUBSTRING_CHARS = 3
+FTS_TABLE = "patients_search_fts"
+
+_mode = "prefix"
+
+
+def mode() -> str:
+    return _mode
+
+
+async def _try(conn: AsyncConnection, sql: str) -> bool:
+    """Run one DDL statement in a savepoint so a failure leaves the outer transaction usable."""
+    try:
+        async with conn.begin_nested():
+            await conn.execute(text(sql))
+        return True
+    except Exception as e:
+        print(f"[patient-search] {sql.split('(')[0].strip()[:80]} failed: {e}")
+        return False
+
+
+async def ensure_indexes(conn: AsyncConnection) -> str:
+    """Create the search indexes for this dialect and remember which backend is usable."""
+    global _mode
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        if await _try(conn, "CREATE EXTENSION IF NOT EXISTS pg_trgm;"):
+            ok = True
+            for name, expr in (("name", "lower(name)"), ("username", "lower(username)"), ("email", "lower(email)"), ("phone", "phone")):
+                ok = await _try(conn, f"CREATE INDEX IF NOT EXISTS ix_patients_{name}_trgm ON patients USING gin ({expr} gin_trgm_ops);") and ok
+            if ok:
+                _mode = "trigram"
+                return _mode
+        for name, expr in (("name", "lower(name)"), ("username", "lower(username)"), ("email", "lower(email)"), ("phone", "phone")):
+            await _try(conn, f"CREATE INDEX IF NOT EXISTS ix_patients_{name}_prefix ON patients ({expr} text_pattern_ops);")
+        _mode = "prefix"
+        return _mode
+    if dialect == "sqlite":
+        existed = (await conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+        )).first() is not None
+        created = existed or await _try(
+            conn,
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, username, email, phone, content='patients', content_rowid='id', tokenize='trigram');",
+        )
+        if created:
+            cols = "name, username, email, phone"
+            new_vals = "new.id, new.name, new.username, new.email, new.phone"
+            old_vals = f"'delete', old.id, old.name, old.username, old.email, old.phone"
+            await _try(conn, f"CREATE TRIGGER IF NOT EXISTS patients_search_ai AFTER INSERT ON patients BEGIN "
+                             f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES ({new_vals}); END;")
+            await _try(conn, f"CREATE TRIGGER IF NOT EXISTS patients_search_ad AFTER DELETE ON patients BEGIN "
+                             f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ({old_vals}); END;")
+            await _try(conn, f"CREATE TRIGGER IF NOT EXISTS patients_search_au AFTER UPDATE OF {cols} ON patients BEGIN "
+                             f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) VALUES ({old_vals}); "
+                             f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES ({new_vals}); END;")
+            if not existed:
+                await _try(conn, f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild');")
+            _mode = "fts5"
+            return _mode
+    _mode = "prefix"
+    return _mode
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fields():
+    pt = models.Patient
+    return func.lower(pt.name), func.lower(pt.username), func.lower(pt.email), pt.phone
+
+
+def _boost(q: str):
+    """2 for an exact identifier hit, 1 for a prefix hit, else 0."""
+    name, username, email, phone = _fields()
+    prefix = _escape_like(q) + "%"
+    return case(
+        (or_(username == q, email == q, phone == q), 2.0),
+        (or_(name.like(prefix, escape="\\"), username.like(prefix, escape="\\"), email.like(prefix, escape="\\"), phone.like(prefix, escape="\\")), 1.0),
+        else_=0.0,
+    )
+
+
+def _prefix_match(q: str):
+    name, username, email, phone = _fields()
+    prefix = _escape_like(q) + "%"
+    return or_(
+        name.like(prefix, escape="\\"),
+        name.like("% " + prefix, escape="\\"),
+        username.like(prefix, escape="\\"),
+        email.like(prefix, escape="\\"),
+        phone.like(prefix, escape="\\"),
+    )
+
+
+def build_query(q: str, *where: Any):
+    """SELECT patients + score for query q (already stripped), ordered best first."""
+    pt = models.Patient
+    q = q.lower()
+    if _mode == "trigram" and len(q) >= MIN_SUBSTRING_CHARS:
+        name, username, email, phone = _fields()
+        contains = "%" + _escape_like(q) + "%"
+        match = or_(
+            name.like(contains, escape="\\"),
+            username.like(contains, escape="\\"),
+            email.like(contains, escape="\\"),
+            phone.like(contains, escape="\\"),
+        )
+        relevance = func.greatest(func.similarity(name, q), func.similarity(username, q), func.similarity(email, q))
+        stmt = select(pt, (_boost(q) + relevance).label("score")).where(match)
+    elif _mode == "fts5" and len(q) >= MIN_SUBSTRING_CHARS:
+        fts = table(FTS_TABLE, column("rowid"))
+        fts_ref = literal_column(FTS_TABLE)
+        phrase = '"' + q.replace('"', '""') + '"'
+        # bm25() is lower-is-better; negate so higher score = better everywhere.
+        stmt = (
+            select(pt, (_boost(q) - func.bm25(fts_ref)).label("score"))
+            .join(fts, fts.c.rowid == pt.id)
+            .where(fts_ref.op("MATCH")(literal(phrase)))
+        )
+    else:
+        stmt = select(pt, _boost(q).label("score")).where(_prefix_match(q))
+    return stmt.where(*where).order_by(literal_column("score").desc(), pt.id.asc())
+
+
+async def search(db: AsyncSession, q: str, *where: Any, limit: int = 20, offset: int = 0) -> list[tuple[Any, float]]:
+    """(Patient, score) pairs for q, optionally narrowed by extra WHERE clauses."""
+    res = await db.execute(build_query(q, *where).limit(limit).offset(offset))
+    return [(row[0], float(row[1] or 0.0)) for row in res.all()]
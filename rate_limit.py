@@ -0,0 +1,217 @@
+"""Token-bucket rate limiting usable as a FastAPI dependency.
+
+Backends (env RATE_LIMIT_BACKEND):
+  * memory: per-process, bounded LRU of buckets (RATE_LIMIT_MEMORY_MAX_KEYS, default 10000).
+  * db: shared across workers via the rate_limit_buckets table. Each take is a single
+    atomic INSERT ... ON CONFLICT DO UPDATE ... RETURNING, so it works on Postgres and
+    on the SQLite fallback without extra locking. Buckets idle long enough to be full
+    again are equivalent to absent ones and are pruned opportunistically.
+Unset, the backend is db when WEB_CONCURRENCY or UVICORN_WORKERS says more than one
+worker runs (per-process buckets would multiply the limit), else memory.
+
+Usage:
+    policy = RateLimitPolicy("instruction_status", capacity=12, refill_per_second=12 / 5)
+    @app.post("/x", dependencies=[Depends(rate_limit(policy, key=get_current_user))])
+
+check(policy, subject) takes a token directly for code that is not a dependency.
+
+Limiter errors fail open (request allowed) and are logged; a denied take raises 429
+with a Retry-After header.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from fastapi import Depends, HTTPException, Request
+from sqlalchemy import case, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+import models
+from database import AsyncSessionLocal, worker_count
+
+
+class RateLimitPolicy:
+    """Bucket of `capacity` tokens refilled continuously at `refill_per_second`."""
+
+    def __init__(self, name: str, capacity: float, refill_per_second: float):
+        self.name = name
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0 and self.refill_per_second > 0
+
+    def retry_after(self, tokens: float) -> int:
+        """Seconds until one full token is available again."""
+        if not self.enabled:
+            return 1
+        return max(1, int(math.ceil((1.0 - tokens) / self.refill_per_second)))
+
+    @property
+    def full_refill_seconds(self) -> float:
+        """Idle time after which any bucket is back at capacity."""
+        return self.capacity / self.refill_per_second if self.enabled else 0.0
+
+
+class MemoryRateLimitBackend:
+    """In-process buckets; least recently used keys are evicted past max_keys."""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max(1, int(max_keys))
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, policy: RateLimitPolicy, now: float) -> tuple[bool, float]:
+        tokens, refreshed_at = self._buckets.pop(key, (policy.capacity, now))
+        tokens = min(policy.capacity, tokens + max(0.0, now - refreshed_at) * policy.refill_per_second)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SqlRateLimitBackend:
+    """Buckets stored in rate_limit_buckets; refill + take happen in one upsert statement."""
+
+    # Buckets of the policy that are full again are purged opportunistically every this many takes.
+    PRUNE_EVERY = 200
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        self._takes = 0
+
+    @staticmethod
+    def _build_take(dialect_name: str, key: str, policy: RateLimitPolicy, now: float):
+        table = models.RateLimitBucket.__table__
+        if dialect_name == "postgresql":
+            insert, least, greatest = postgresql.insert, func.least, func.greatest
+        elif dialect_name == "sqlite":
+            # SQLite's multi-argument min()/max() are the scalar LEAST/GREATEST equivalents.
+            insert, least, greatest = sqlite.insert, func.min, func.max
+        else:
+            raise RuntimeError(f"rate limit backend not supported for dialect '{dialect_name}'")
+
+        elapsed = greatest(0.0, now - table.c.refreshed_at)
+        refilled = least(policy.capacity, table.c.tokens + elapsed * policy.refill_per_second)
+        stmt = insert(table).values(
+            key=key,
+            tokens=policy.capacity - 1.0,
+            refreshed_at=now,
+            last_allowed=True,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "tokens": case((refilled >= 1.0, refilled - 1.0), else_=refilled),
+                "refreshed_at": now,
+                "last_allowed": refilled >= 1.0,
+            },
+        )
+        return stmt.returning(table.c.tokens, table.c.last_allowed)
+
+    async def take(self, key: str, policy: RateLimitPolicy, now: float) -> tuple[bool, float]:
+        # Own short transaction so limiter state commits independently of the request.
+        async with self._session_factory() as db:
+            stmt = self._build_take(db.get_bind().dialect.name, key, policy, now)
+            row = (await db.execute(stmt)).first()
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                table = models.RateLimitBucket.__table__
+                await db.execute(
+                    delete(table)
+                    .where(table.c.key.startswith(f"{policy.name}:", autoescape=True))
+                    .where(table.c.refreshed_at < now - policy.full_refill_seconds)
+                )
+            await db.commit()
+        if row is None:
+            return True, policy.capacity
+        return bool(row.last_allowed), float(row.tokens)
+
+
+def _make_backend():
+    name = os.getenv("RATE_LIMIT_BACKEND", "").strip().lower()
+    if not name:
+        name = "db" if worker_count() > 1 else "memory"
+    if name in {"db", "sql", "postgres", "sqlite"}:
+        return SqlRateLimitBackend()
+    try:
+        max_keys = int(os.getenv("RATE_LIMIT_MEMORY_MAX_KEYS", "10000"))
+    except Exception:
+        max_keys = 10000
+    return MemoryRateLimitBackend(max_keys=max_keys)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = _make_backend()
+        print(f"[rate-limit] backend={type(_backend).__name__}")
+    return _backend
+
+
+async def check(policy: RateLimitPolicy, subject: str, detail: Optional[str] = None) -> None:
+    """Take one token for subject under policy; raise 429 when the bucket is empty."""
+    if not policy.enabled:
+        return
+    try:
+        allowed, tokens = await get_backend().take(f"{policy.name}:{subject}", policy, time.time())
+    except Exception as e:
+        # Fail open on limiter errors
+        print(f"[rate-limit] {policy.name} check failed (allowing): {e}")
+        return
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=detail or "Too many requests; please retry shortly.",
+            headers={"Retry-After": str(policy.retry_after(tokens))},
+        )
+
+
+def _client_ip(request: Request) -> str:
+    fwd = request.headers.get("x-forwarded-for")
+    if fwd:
+        return fwd.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(
+    policy: RateLimitPolicy,
+    key: Optional[Callable[..., Any]] = None,
+    detail: Optional[str] = None,
+    on_denied: Optional[Callable[[Any], None]] = None,
+):
+    """Build a FastAPI dependency enforcing policy.
+
+    key: optional dependency (e.g. get_current_user) whose result keys the bucket; its
+    `id` is used when it has one. Returning None lets the request through uncharged.
+    Without key the client IP is used.
+    on_denied: called with the key's result before the 429 is raised, to undo anything
+    the key dependency claimed for the request.
+    """
+    async def _enforce(subject: Any) -> None:
+        if subject is None:
+            return
+        try:
+            await check(policy, str(getattr(subject, "id", subject)), detail)
+        except HTTPException:
+            if on_denied is not None:
+                on_denied(subject)
+            raise
+
+    if key is None:
+        async def _by_ip(request: Request) -> None:
+            await _enforce(_client_ip(request))
+        return _by_ip
+
+    async def _by_key(subject: Any = Depends(key)) -> None:
+        await _enforce(subject)
+    return _by_key
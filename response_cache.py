@@ -0,0 +1,230 @@
+"""Response cache for doctor dashboard lists (/patients/by-doctor, /patients/by-doctor-episodes).
+
+Entries are serialized JSON bodies keyed by (scope, key): scope is the doctor
+(see doctor_scope) and key the endpoint plus its query params. An entry lives
+for RESPONSE_CACHE_TTL_SECONDS (default 30) or until invalidate(scope) is
+called by a patient/episode write that touched that doctor, whichever is first.
+
+Backends (env RESPONSE_CACHE_BACKEND):
+  * memory: per-process LRU (RESPONSE_CACHE_MEMORY_MAX_KEYS, default 2000).
+    invalidate() bumps the scope's generation, so stale entries are never read
+    again and age out of the LRU. Only this process sees the invalidation.
+  * db: response_cache_entries table shared by all workers; invalidate() deletes
+    the scope's rows, so a write on one worker is seen by every worker.
+Unset, the backend is db when WEB_CONCURRENCY or UVICORN_WORKERS says more
+than one worker runs, else memory.
+  * off: no caching.
+
+Cache errors are logged and treated as misses; the endpoint then runs normally.
+stats() feeds /diag/cache.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import doctor_directory
+import models
+from database import AsyncSessionLocal, worker_count
+
+
+def doctor_scope(doctor_id: Optional[int], doctor_name: Optional[str]) -> Optional[str]:
+    """Cache scope for a doctor: the doctors.id when known, else the normalized name."""
+    if doctor_id is not None:
+        return f"doctor:{int(doctor_id)}"
+    name = doctor_directory.normalize_doctor_name(doctor_name)
+    return f"doctor-name:{name}" if name else None
+
+
+class MemoryResponseCache:
+    def __init__(self, max_keys: int = 2000):
+        self.max_keys = max(1, int(max_keys))
+        self._items: "OrderedDict[str, tuple[float, bytes]]" = OrderedDict()
+        self._generations: dict[str, int] = {}
+        self._global_generation = 0
+
+    def _key(self, scope: str, key: str) -> str:
+        return f"{self._global_generation}:{scope}#{self._generations.get(scope, 0)}|{key}"
+
+    async def get(self, scope: str, key: str) -> Optional[bytes]:
+        full = self._key(scope, key)
+        hit = self._items.get(full)
+        if hit is None:
+            return None
+        expires, body = hit
+        if expires <= time.monotonic():
+            del self._items[full]
+            return None
+        self._items.move_to_end(full)
+        return body
+
+    async def put(self, scope: str, key: str, body: bytes, ttl_s: int) -> None:
+        full = self._key(scope, key)
+        self._items[full] = (time.monotonic() + ttl_s, body)
+        self._items.move_to_end(full)
+        while len(self._items) > self.max_keys:
+            self._items.popitem(last=False)
+
+    async def invalidate(self, scope: str) -> None:
+        self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    async def invalidate_all(self) -> None:
+        self._global_generation += 1
+        self._generations.clear()
+
+    def size(self) -> int:
+        return len(self._items)
+
+
+class DbResponseCache:
+    # Expired rows are purged opportunistically every this many writes.
+    PRUNE_EVERY = 200
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        self._writes = 0
+
+    async def get(self, scope: str, key: str) -> Optional[bytes]:
+        ent = models.ResponseCacheEntry
+        async with self._session_factory() as db:
+            row = (await db.execute(
+                select(ent.body).where(ent.scope == scope, ent.key == key, ent.expires_at > datetime.utcnow())
+            )).first()
+        return bytes(row.body) if row is not None else None
+
+    async def put(self, scope: str, key: str, body: bytes, ttl_s: int) -> None:
+        ent = models.ResponseCacheEntry
+        now = datetime.utcnow()
+        values = {"scope": scope, "key": key, "body": body, "expires_at": now + timedelta(seconds=ttl_s)}
+        async with self._session_factory() as db:
+            insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+            stmt = insert(ent.__table__).values(**values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ent.__table__.c.scope, ent.__table__.c.key],
+                set_={"body": stmt.excluded.body, "expires_at": stmt.excluded.expires_at},
+            )
+            await db.execute(stmt)
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                await db.execute(delete(ent).where(ent.expires_at <= now))
+            await db.commit()
+
+    async def invalidate(self, scope: str) -> None:
+        ent = models.ResponseCacheEntry
+        async with self._session_factory() as db:
+            await db.execute(delete(ent).where(ent.scope == scope))
+            await db.commit()
+
+    async def invalidate_all(self) -> None:
+        ent = models.ResponseCacheEntry
+        async with self._session_factory() as db:
+            await db.execute(delete(ent))
+            await db.commit()
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class ResponseCache:
+    """Backend wrapper that counts hits/misses and swallows backend errors."""
+
+    def __init__(self, backend, ttl_seconds: int):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def get(self, scope: Optional[str], key: str) -> Optional[bytes]:
+        if not self.enabled or scope is None:
+            return None
+        try:
+            body = await self.backend.get(scope, key)
+        except Exception as e:
+            self.errors += 1
+            print(f"[response-cache] get failed: {e}")
+            body = None
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body
+
+    async def put(self, scope: Optional[str], key: str, body: bytes) -> None:
+        if not self.enabled or scope is None:
+            return
+        try:
+            await self.backend.put(scope, key, body, self.ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            print(f"[response-cache] put failed: {e}")
+
+    async def invalidate(self, *scopes: Optional[str]) -> None:
+        if not self.enabled:
+            return
+        for scope in {s for s in scopes if s}:
+            try:
+                await self.backend.invalidate(scope)
+                self.invalidations += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"[response-cache] invalidate {scope} failed: {e}")
+
+    async def invalidate_all(self) -> None:
+        if not self.enabled:
+            return
+        try:
+            await self.backend.invalidate_all()
+            self.invalidations += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"[response-cache] invalidate_all failed: {e}")
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else "off",
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "entries": self.backend.size() if self.backend is not None else 0,
+        }
+
+
+def _make_cache() -> ResponseCache:
+    try:
+        ttl = max(1, int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30")))
+    except Exception:
+        ttl = 30
+    name = os.getenv("RESPONSE_CACHE_BACKEND", "").strip().lower()
+    if not name:
+        # A per-process LRU never sees another worker's invalidations, so with
+        # several workers the shared table is the only safe default.
+        name = "db" if worker_count() > 1 else "memory"
+        if name == "db":
+            print(f"[response-cache] {worker_count()} workers; defaulting to the db backend")
+    if name in {"off", "none", "0", "false", "no"}:
+        return ResponseCache(None, ttl)
+    if name in {"db", "sql", "postgres", "sqlite"}:
+        return ResponseCache(DbResponseCache(), ttl)
+    try:
+        max_keys = int(os.getenv("RESPONSE_CACHE_MEMORY_MAX_KEYS", "2000"))
+    except Exception:
+        max_keys = 2000
+    return ResponseCache(MemoryResponseCache(max_keys=max_keys), ttl)
+
+
+dashboard_cache = _make_cache()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, ConfigDict
 from datetime import datetime, date, time
-from typing import Optional, List
+from typing import Optional, List, Union
 
 class LoginRequest(BaseModel):
     username: str
@@ -172,8 +172,13 @@ class InstructionStatusBulkCreate(BaseModel):
 class InstructionStatusResponse(InstructionStatusItem):
     id: int
     patient_id: int
+    change_seq: Optional[int] = None
     model_config = ConfigDict(from_attributes=True)
 
+class InstructionStatusUpsertResponse(InstructionStatusResponse):
+    # False when the submitted item matched the stored row and no write happened.
+    changed: bool = True
+
 class DailyInstructionSummary(BaseModel):
     date: date
     followed: int
@@ -352,6 +357,25 @@ class ReminderResponse(ReminderBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class PatientSearchHit(BaseModel):
+    patient_id: int
+    username: str
+    name: str
+    phone: str
+    email: str
+    doctor: Optional[str] = None
+    treatment: Optional[str] = None
+    treatment_subtype: Optional[str] = None
+    score: float
+
+
+class PatientSearchResponse(BaseModel):
+    query: str
+    mode: str  # search backend: trigram | fts5 | prefix
+    results: List[PatientSearchHit]
+    next_cursor: Optional[str] = None
+
+
 class PatientEpisodePublic(BaseModel):
     patient_id: int
     episode_id: int
@@ -364,4 +388,15 @@ class PatientEpisodePublic(BaseModel):
     procedure_date: Optional[date] = None
     procedure_time: Optional[time] = None
     procedure_completed: Optional[bool] = None
-    locked: Optional[bool] = None
\ No newline at end of file
+    locked: Optional[bool] = None
+
+
+class DoctorPatientOverview(BaseModel):
+    username: str
+    sections: List[str]
+    info: Optional[dict] = None
+    episodes: Optional[List[EpisodeResponse]] = None
+    instruction_status: Optional[Union[InstructionStatusEnhancedResponse, InstructionStatusFullResponse]] = None
+    progress: Optional[List[ProgressEntry]] = None
+    chat: Optional[List[ChatMessage]] = None
+    errors: dict[str, str] = {}
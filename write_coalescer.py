@@ -0,0 +1,148 @@
+"""Per-patient write coalescing for POST /instruction-status.
+
+The checklist UI posts on every tap. With coalescing enabled
+(INSTR_STATUS_COALESCE_MS > 0, default 0 = off) the first submission for a
+patient opens a batch; submissions arriving within the window join it and
+the whole batch is upserted in one transaction when the window closes.
+A patient's batches are committed one after another in the order they were
+opened, so a slow flush can never land after (and overwrite) a newer one.
+
+Each caller waits for the batch commit and gets back the persisted rows for
+the items it submitted (read-your-writes; later taps in the same batch win).
+flush_all() is called from the app shutdown hook so nothing buffered is lost.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Iterable, Optional
+
+from database import AsyncSessionLocal
+import instruction_upsert
+
+
+def _item_key(item: Any) -> tuple:
+    return (item.date, item.group, item.instruction_index)
+
+
+class _Batch:
+    def __init__(self, patient_id: int):
+        self.patient_id = patient_id
+        self.items: dict[tuple, Any] = {}
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.timer: Optional[asyncio.Task] = None
+        # Batch opened before this one for the same patient; flushed first.
+        self.previous: Optional["_Batch"] = None
+
+
+class InstructionWriteCoalescer:
+    def __init__(self, window_ms: int = 0, session_factory=AsyncSessionLocal):
+        self.window_s = max(0, int(window_ms)) / 1000.0
+        self._session_factory = session_factory
+        self._open: dict[int, _Batch] = {}
+        # patient_id -> monotonic time the current coalescing window closes
+        self._windows: dict[int, float] = {}
+        # patient_id -> most recently opened batch, until it has been flushed
+        self._last: dict[int, _Batch] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_s > 0
+
+    def in_window(self, patient_id: int) -> bool:
+        """True when a submission now would join patient_id's open batch window."""
+        return patient_id in self._open or self._windows.get(patient_id, 0.0) > time.monotonic()
+
+    def opens_window(self, patient_id: int) -> bool:
+        """Claim a new batch window for patient_id; False if one is already open.
+
+        Synchronous check-and-claim, so concurrent requests agree on which one
+        opened the window. Claim before any await; if the request is then refused,
+        hand the claim back with release_window().
+        """
+        now = time.monotonic()
+        if self.in_window(patient_id):
+            return False
+        self._windows[patient_id] = now + self.window_s
+        # Drop expired claims so the map stays bounded by active patients.
+        if len(self._windows) > 1024:
+            for pid in [p for p, until in self._windows.items() if until <= now]:
+                del self._windows[pid]
+        return True
+
+    def release_window(self, patient_id: int) -> None:
+        """Drop a claim made by opens_window() for a request that was not admitted."""
+        self._windows.pop(patient_id, None)
+
+    async def submit(self, patient_id: int, items: Iterable[Any]) -> list[tuple[Any, bool]]:
+        """Buffer items for patient_id and wait until their batch is committed.
+
+        Returns (row, changed) pairs for this caller's items, in submission order.
+        """
+        keys = []
+        batch = self._open.get(patient_id)
+        if batch is None:
+            batch = _Batch(patient_id)
+            batch.previous = self._last.get(patient_id)
+            self._open[patient_id] = batch
+            self._last[patient_id] = batch
+            batch.timer = asyncio.create_task(self._flush_after_window(batch))
+        for item in items:
+            key = _item_key(item)
+            batch.items[key] = item  # last wins within the batch
+            keys.append(key)
+        # shield: a disconnecting caller must not cancel the shared batch.
+        results = await asyncio.shield(batch.done)
+        return [results[k] for k in dict.fromkeys(keys) if k in results]
+
+    async def _flush_after_window(self, batch: _Batch) -> None:
+        try:
+            await asyncio.sleep(self.window_s)
+        except asyncio.CancelledError:
+            # flush_all() took over this batch.
+            return
+        await self._flush(batch)
+
+    async def _flush(self, batch: _Batch) -> None:
+        # Close the batch first so new submissions start a fresh one.
+        if self._open.get(batch.patient_id) is batch:
+            del self._open[batch.patient_id]
+        if batch.done.done():
+            return
+        previous, batch.previous = batch.previous, None
+        if previous is not None and not previous.done.done():
+            # Later taps win: never commit ahead of an older batch still in flight.
+            await asyncio.wait([previous.done])
+        try:
+            async with self._session_factory() as db:
+                rows = await instruction_upsert.upsert_instruction_statuses(db, batch.patient_id, batch.items.values())
+                await db.commit()
+            results = {(row.date, row.group, row.instruction_index): (row, changed) for row, changed in rows}
+            batch.done.set_result(results)
+        except Exception as e:
+            print(f"[coalesce] flush failed for patient {batch.patient_id} ({len(batch.items)} items): {e}")
+            batch.done.set_exception(e)
+        finally:
+            if self._last.get(batch.patient_id) is batch:
+                del self._last[batch.patient_id]
+
+    async def flush_all(self) -> None:
+        """Flush every open batch immediately (used on shutdown)."""
+        batches = list(self._open.values())
+        for batch in batches:
+            if batch.timer is not None:
+                batch.timer.cancel()
+        for batch in batches:
+            await self._flush(batch)
+        if batches:
+            print(f"[coalesce] flushed {len(batches)} open batch(es)")
+
+
+def _window_ms_from_env() -> int:
+    try:
+        return int(os.getenv("INSTR_STATUS_COALESCE_MS", "0"))
+    except Exception:
+        return 0
+
+
+instruction_coalescer = InstructionWriteCoalescer(_window_ms_from_env())